@@ -0,0 +1,99 @@
+"""Vérification des réponses des joueurs.
+
+Chaque question compile une fois, au chargement, ses réponses acceptées en un
+`AnswerMatcher` : minuscules, accents et ponctuation retirés, articles en tête
+ignorés (« La Tour Eiffel » == « tour eiffel »), espaces ignorés (« spider-man »
+== « spiderman »). Plusieurs réponses peuvent être acceptées en les séparant par
+`|` dans le champ `answer` (« Tahiti Bob|Sideshow Bob »), la première étant celle
+affichée aux joueurs.
+
+Les fautes de frappe sont tolérées selon la longueur de la réponse (distance
+d'édition bornée, abandonnée dès que la borne est dépassée). Une réponse qui
+contient des chiffres doit être exacte : 1998 n'est pas 1999.
+"""
+import os
+import re
+import unicodedata
+from typing import FrozenSet, Tuple
+
+ALIAS_SEPARATOR = "|"
+# Articles ignorés en tête de réponse (après pliage : « l'île » -> « l ile »)
+ARTICLES = frozenset({"le", "la", "les", "l", "un", "une", "des", "du", "de", "d", "the", "a", "an"})
+# 0 pour n'accepter que les réponses exactes (après normalisation)
+ANSWER_MAX_TYPOS = int(os.getenv("ANSWER_MAX_TYPOS", "2"))
+
+_COMBINING_MARKS = re.compile("[\u0300-\u036f]")
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def fold(value: str) -> str:
+    """Minuscules, sans accents ni ponctuation : « Où est Tahiti-Bob ? » -> « ou est tahiti bob »"""
+    decomposed = unicodedata.normalize("NFKD", value.casefold())
+    return _NON_WORD.sub(" ", _COMBINING_MARKS.sub("", decomposed)).strip()
+
+
+def answer_key(answer: str) -> str:
+    """Forme comparée : pliée, sans article en tête ni espaces"""
+    words = fold(answer).split()
+    while len(words) > 1 and words[0] in ARTICLES:
+        words.pop(0)
+    return "".join(words)
+
+
+def allowed_typos(key: str) -> int:
+    """Fautes tolérées : aucune pour une réponse courte ou chiffrée, 1 jusqu'à 8 lettres, 2 au-delà"""
+    if len(key) <= 4 or any(c.isdigit() for c in key):
+        return 0
+    return min(ANSWER_MAX_TYPOS, 1 if len(key) <= 8 else 2)
+
+
+def within_distance(a: str, b: str, max_distance: int) -> bool:
+    """Distance de Levenshtein entre a et b <= max_distance.
+
+    Seule la bande diagonale de largeur 2 * max_distance + 1 est calculée, et le calcul
+    s'arrête dès qu'une ligne entière dépasse la borne."""
+    if abs(len(a) - len(b)) > max_distance:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    too_far = max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        low, high = max(1, i - max_distance), min(len(b), i + max_distance)
+        current = [too_far] * (len(b) + 1)
+        current[low - 1] = i if low == 1 else too_far
+        best = current[low - 1]
+        for j in range(low, high + 1):
+            cost = previous[j - 1] + (char_a != b[j - 1])
+            cost = min(cost, previous[j] + 1, current[j - 1] + 1)
+            current[j] = cost
+            if cost < best:
+                best = cost
+        if best > max_distance:
+            return False
+        previous = current
+    return previous[len(b)] <= max_distance
+
+
+class AnswerMatcher:
+    """Réponses acceptées d'une question, normalisées une seule fois"""
+    __slots__ = ("display", "_exact", "_fuzzy")
+
+    def __init__(self, answer: str):
+        aliases = [alias.strip() for alias in answer.split(ALIAS_SEPARATOR) if alias.strip()]
+        # Réponse affichée à la révélation
+        self.display = aliases[0] if aliases else answer.strip()
+        keys = {answer_key(alias) for alias in aliases} - {""}
+        self._exact: FrozenSet[str] = frozenset(keys)
+        self._fuzzy: Tuple[Tuple[str, int], ...] = tuple(
+            (key, typos) for key in sorted(keys) if (typos := allowed_typos(key)) > 0)
+
+    def matches(self, guess: str) -> bool:
+        key = answer_key(guess)
+        if not key:
+            return False
+        if key in self._exact:
+            return True
+        if any(c.isdigit() for c in key):
+            return False
+        return any(within_distance(key, accepted, typos) for accepted, typos in self._fuzzy)
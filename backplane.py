@@ -0,0 +1,200 @@
+"""Bus de messages entre workers pour qu'une même salle puisse vivre sur plusieurs processus.
+
+Chaque worker publie les broadcasts et les mutations d'état de ses salles ; les autres
+workers les reçoivent et les appliquent à leurs propres joueurs. Implémentations :
+
+- `InProcessBackplane` : workers d'un même processus reliés par un `InProcessHub`
+  (par défaut un seul worker, donc rien à transmettre). Sert aussi de bouchon pour
+  simuler plusieurs workers dans les tests, sans base de données.
+- `PostgresBackplane` : LISTEN/NOTIFY sur la base pointée par DATABASE_URL. Un événement
+  trop gros pour NOTIFY (classement ou état complet d'une grande salle) est écrit dans la
+  table `backplane_events` et la notification n'en porte que l'id.
+
+Sélection via la variable d'environnement BACKPLANE (`memory` par défaut, ou `postgres`).
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional
+
+BACKPLANE = os.getenv("BACKPLANE", "memory")
+BACKPLANE_CHANNEL = os.getenv("BACKPLANE_CHANNEL", "party_game")
+
+# Limite de taille d'un payload NOTIFY côté PostgreSQL (8000 octets)
+NOTIFY_MAX_BYTES = 7900
+# Événements plus gros : table relue par les autres workers, purgée après OVERFLOW_RETENTION secondes
+OVERFLOW_TABLE = "backplane_events"
+OVERFLOW_RETENTION = 60
+
+EventHandler = Callable[[dict], Awaitable[None]]
+
+
+class Backplane:
+    """Interface commune. Un événement est un dict sérialisable en JSON."""
+
+    def __init__(self, worker_id: Optional[str] = None):
+        self.worker_id = worker_id or uuid.uuid4().hex[:12]
+        self._handler: Optional[EventHandler] = None
+
+    async def start(self, handler: EventHandler):
+        self._handler = handler
+
+    async def stop(self):
+        self._handler = None
+
+    async def publish(self, event: dict):
+        raise NotImplementedError
+
+    async def _dispatch(self, event: dict):
+        # Ignorer nos propres événements
+        if event.get("origin") == self.worker_id or self._handler is None:
+            return
+        try:
+            await self._handler(event)
+        except Exception:
+            logging.exception("Erreur lors du traitement d'un événement du backplane")
+
+
+class InProcessHub:
+    """Relie plusieurs InProcessBackplane d'un même processus"""
+
+    def __init__(self):
+        self.members: List["InProcessBackplane"] = []
+
+
+class InProcessBackplane(Backplane):
+
+    def __init__(self, hub: Optional[InProcessHub] = None, worker_id: Optional[str] = None):
+        super().__init__(worker_id)
+        self.hub = hub or InProcessHub()
+
+    async def start(self, handler: EventHandler):
+        await super().start(handler)
+        self.hub.members.append(self)
+
+    async def stop(self):
+        if self in self.hub.members:
+            self.hub.members.remove(self)
+        await super().stop()
+
+    async def publish(self, event: dict):
+        event["origin"] = self.worker_id
+        for member in list(self.hub.members):
+            if member is not self:
+                await member._dispatch(event)
+
+
+class PostgresBackplane(Backplane):
+    """LISTEN/NOTIFY via psycopg2. La réception passe par `loop.add_reader`,
+    l'envoi par un thread dédié pour ne pas bloquer la boucle d'événements.
+    Les événements reçus sont traités un par un, dans l'ordre, par une seule tâche."""
+
+    def __init__(self, dsn: str, channel: str = BACKPLANE_CHANNEL, worker_id: Optional[str] = None):
+        super().__init__(worker_id)
+        # SQLAlchemy accepte "postgresql+psycopg2://", pas libpq
+        scheme, sep, rest = dsn.partition("://")
+        self.dsn = scheme.split("+")[0] + sep + rest
+        self.channel = channel
+        self._listen_conn = None
+        self._notify_conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backplane")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+
+    async def start(self, handler: EventHandler):
+        import psycopg2
+
+        await super().start(handler)
+        self._loop = asyncio.get_running_loop()
+        self._listen_conn = psycopg2.connect(self.dsn)
+        self._listen_conn.autocommit = True
+        with self._listen_conn.cursor() as cur:
+            cur.execute(
+                f"CREATE TABLE IF NOT EXISTS {OVERFLOW_TABLE} ("
+                "id BIGSERIAL PRIMARY KEY, payload TEXT NOT NULL, created_at TIMESTAMPTZ NOT NULL DEFAULT now())")
+            cur.execute(f'LISTEN "{self.channel}"')
+        self._notify_conn = psycopg2.connect(self.dsn)
+        self._notify_conn.autocommit = True
+        self._queue = asyncio.Queue()
+        self._consumer = asyncio.create_task(self._consume())
+        self._loop.add_reader(self._listen_conn.fileno(), self._on_readable)
+        logging.info(f"Backplane PostgreSQL démarré (worker {self.worker_id})")
+
+    async def stop(self):
+        if self._loop is not None and self._listen_conn is not None:
+            self._loop.remove_reader(self._listen_conn.fileno())
+        if self._consumer is not None:
+            self._consumer.cancel()
+            self._consumer = None
+        for conn in (self._listen_conn, self._notify_conn):
+            if conn is not None:
+                conn.close()
+        self._executor.shutdown(wait=False)
+        await super().stop()
+
+    def _on_readable(self):
+        self._listen_conn.poll()
+        while self._listen_conn.notifies:
+            notify = self._listen_conn.notifies.pop(0)
+            try:
+                event = json.loads(notify.payload)
+            except ValueError:
+                continue
+            if event.get("origin") != self.worker_id:
+                self._queue.put_nowait(event)
+
+    async def _consume(self):
+        """Une seule tâche : un handler qui attend (chargement d'une question) ne laisse pas
+        passer l'événement suivant devant lui"""
+        while True:
+            event = await self._queue.get()
+            if "ref" in event:
+                try:
+                    event = await self._loop.run_in_executor(self._executor, self._fetch, event["ref"])
+                except Exception:
+                    logging.exception("Impossible de relire un événement du backplane PostgreSQL")
+                    continue
+                if event is None:
+                    logging.warning("Événement backplane expiré avant d'être relu, ignoré")
+                    continue
+            await self._dispatch(event)
+
+    def _fetch(self, ref: int) -> Optional[dict]:
+        with self._notify_conn.cursor() as cur:
+            cur.execute(f"SELECT payload FROM {OVERFLOW_TABLE} WHERE id = %s", (ref,))
+            row = cur.fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _notify(self, payload: str):
+        with self._notify_conn.cursor() as cur:
+            if len(payload.encode("utf-8")) > NOTIFY_MAX_BYTES:
+                # Trop gros pour NOTIFY : le contenu passe par la table, la notification porte son id
+                cur.execute(f"INSERT INTO {OVERFLOW_TABLE} (payload) VALUES (%s) RETURNING id", (payload,))
+                payload = json.dumps({"ref": cur.fetchone()[0], "origin": self.worker_id})
+                if time.monotonic() - self._last_purge > OVERFLOW_RETENTION:
+                    self._last_purge = time.monotonic()
+                    cur.execute(
+                        f"DELETE FROM {OVERFLOW_TABLE} WHERE created_at < now() - make_interval(secs => %s)",
+                        (OVERFLOW_RETENTION,))
+            cur.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+
+    async def publish(self, event: dict):
+        event["origin"] = self.worker_id
+        payload = json.dumps(event, ensure_ascii=False, separators=(",", ":"))
+        try:
+            await self._loop.run_in_executor(self._executor, self._notify, payload)
+        except Exception:
+            logging.exception("Impossible de publier sur le backplane PostgreSQL")
+
+
+def create_backplane() -> Backplane:
+    """Construit le backplane choisi par la variable d'environnement BACKPLANE"""
+    if BACKPLANE == "postgres":
+        return PostgresBackplane(os.environ["DATABASE_URL"])
+    return InProcessBackplane()
@@ -0,0 +1,288 @@
+"""Banc de charge WebSocket : simule des centaines/milliers de joueurs sur le vrai protocole.
+
+Le script démarre l'application en local (uvicorn dans un sous-processus, sur une base
+SQLite temporaire par défaut), crée des questions via l'API, puis connecte les joueurs
+simulés qui enchaînent `set_name`, `ready`, des réponses fausses et justes, et parfois
+une déconnexion en cours de partie.
+
+Rapport : latence de diffusion des questions (p50/p95/p99), aller-retour des réponses,
+réponses traitées par seconde et mémoire du serveur par connexion.
+
+Usage:
+    python benchmark.py --clients 500 --rooms 10
+    python benchmark.py --clients 2000 --rooms 100 --database-url postgresql://...
+    python benchmark.py --url http://127.0.0.1:8000 --clients 200   # serveur déjà lancé
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import deque
+from typing import Deque, List, Optional
+
+import websockets
+
+
+class Stats:
+    def __init__(self):
+        self.question_latency: List[float] = []
+        self.answer_rtt: List[float] = []
+        self.answers_sent = 0
+        self.answers_correct = 0
+        self.frames = 0
+        self.bytes = 0
+        self.connected = 0
+        self.failed = 0
+        self.disconnected = 0
+        self.first_answer_at: Optional[float] = None
+        self.last_result_at: Optional[float] = None
+
+
+def percentiles(values: List[float]) -> str:
+    if not values:
+        return "n/a"
+    values = sorted(values)
+    def pick(p):
+        return values[min(len(values) - 1, int(p * len(values)))] * 1000
+    return (f"p50={pick(0.50):.1f}ms p95={pick(0.95):.1f}ms p99={pick(0.99):.1f}ms "
+            f"max={values[-1] * 1000:.1f}ms (n={len(values)})")
+
+
+class SimulatedPlayer:
+    def __init__(self, bench: "Benchmark", room: str, index: int, disconnect_at: Optional[int]):
+        self.bench = bench
+        self.room = room
+        self.player_id = f"bench_{room}_{index}"
+        self.disconnect_at = disconnect_at
+        self.pending_answers: Deque[float] = deque()
+        self.questions_seen = 0
+
+    async def send(self, ws, message: dict):
+        await ws.send(json.dumps(message))
+
+    async def answer(self, ws, message: dict):
+        stats = self.bench.stats
+        question = message.get("data", {}).get("question")
+        correct = self.bench.answers.get(question, "?")
+        duration = float(message.get("time_left") or message.get("duration") or 10)
+        await asyncio.sleep(random.uniform(0, 0.5 * duration))
+        attempts = ["mauvaise réponse"] if random.random() < self.bench.args.wrong_ratio else []
+        attempts.append(correct)
+        for attempt in attempts:
+            now = time.time()
+            if stats.first_answer_at is None:
+                stats.first_answer_at = now
+            self.pending_answers.append(now)
+            stats.answers_sent += 1
+            await self.send(ws, {"type": "answer", "answer": attempt})
+            await asyncio.sleep(0.2)
+
+    async def run(self):
+        stats = self.bench.stats
+        url = f"{self.bench.ws_url}/ws/{self.room}/{self.player_id}"
+        try:
+            ws = await websockets.connect(url, max_size=None, open_timeout=30)
+        except Exception:
+            stats.failed += 1
+            return
+        stats.connected += 1
+        tasks = []
+        try:
+            await self.bench.all_connected.wait()
+            await self.send(ws, {"type": "set_name", "name": self.player_id})
+            await self.send(ws, {"type": "ready"})
+            async for raw in ws:
+                now = time.time()
+                stats.frames += 1
+                stats.bytes += len(raw)
+                message = json.loads(raw)
+                kind = message.get("type")
+
+                if kind == "question":
+                    self.questions_seen += 1
+                    if "sent_at" in message:
+                        stats.question_latency.append(now - message["sent_at"])
+                    if self.disconnect_at is not None and self.questions_seen >= self.disconnect_at:
+                        stats.disconnected += 1
+                        break
+                    tasks.append(asyncio.create_task(self.answer(ws, message)))
+                elif kind == "answer_result":
+                    if self.pending_answers:
+                        stats.answer_rtt.append(now - self.pending_answers.popleft())
+                    stats.last_result_at = now
+                    if message.get("correct"):
+                        stats.answers_correct += 1
+                elif kind == "ping":
+                    await self.send(ws, {"type": "pong"})
+                elif kind == "prefetch":
+                    await self.send(ws, {"type": "image_loaded", "question_number": message["question_number"],
+                                         "load_ms": 0, "source": "prefetch"})
+                elif kind == "waiting_next_question":
+                    await self.send(ws, {"type": "ready"})
+                elif kind == "game_over":
+                    break
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            await ws.close()
+
+
+class Benchmark:
+    def __init__(self, args):
+        self.args = args
+        self.stats = Stats()
+        self.answers = {}
+        self.server: Optional[subprocess.Popen] = None
+        self.base_url = args.url
+        self.ws_url = ""
+        self.all_connected = asyncio.Event()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def start_server(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        database_url = self.args.database_url or f"sqlite:///{os.path.join(self.tmpdir.name, 'bench.db')}"
+        env = dict(
+            os.environ,
+            DATABASE_URL=database_url,
+            QUESTION_DURATION=str(self.args.question_duration),
+            REVEAL_DURATION=str(self.args.reveal_duration),
+            GAME_START_DELAY="0.5",
+            QUESTIONS_PER_GAME=str(self.args.questions),
+        )
+        self.server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning", "--ws-max-queue", "1024"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        )
+        self.base_url = f"http://127.0.0.1:{port}"
+
+    def stop_server(self):
+        if self.server is not None:
+            self.server.terminate()
+            self.server.wait()
+        self.tmpdir.cleanup()
+
+    def server_rss_kb(self) -> Optional[int]:
+        if self.server is None:
+            return None
+        try:
+            with open(f"/proc/{self.server.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1])
+        except OSError:
+            return None
+        return None
+
+    def http(self, method: str, path: str, body: Optional[dict] = None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read() or b"null")
+
+    async def wait_for_server(self):
+        for _ in range(100):
+            try:
+                await asyncio.to_thread(self.http, "GET", "/api/rooms")
+                return
+            except Exception:
+                await asyncio.sleep(0.2)
+        raise RuntimeError("Le serveur ne répond pas")
+
+    def seed_questions(self):
+        for i in range(self.args.questions):
+            question = f"Question de bench n°{i} ({os.urandom(3).hex()})"
+            answer = f"reponse {i}"
+            self.http("POST", "/api/questions", {
+                "image": "/static/assets/tahiti-bob.jpg", "question": question, "answer": answer
+            })
+            self.answers[question] = answer
+
+    async def run(self):
+        args = self.args
+        if not self.base_url:
+            self.start_server()
+        self.ws_url = self.base_url.replace("http", "ws", 1)
+        try:
+            await self.wait_for_server()
+            await asyncio.to_thread(self.seed_questions)
+            rss_before = self.server_rss_kb()
+
+            players = []
+            for i in range(args.clients):
+                room = f"bench{i % args.rooms}"
+                disconnect_at = random.randint(1, args.questions) if random.random() < args.disconnect_ratio else None
+                players.append(SimulatedPlayer(self, room, i, disconnect_at))
+
+            tasks = []
+            for start in range(0, len(players), args.connect_batch):
+                for player in players[start:start + args.connect_batch]:
+                    tasks.append(asyncio.create_task(player.run()))
+                await asyncio.sleep(0.05)
+            while self.stats.connected + self.stats.failed < len(players):
+                await asyncio.sleep(0.1)
+            rss_connected = self.server_rss_kb()
+            self.all_connected.set()
+
+            started = time.time()
+            await asyncio.wait(tasks, timeout=args.timeout)
+            elapsed = time.time() - started
+            self.report(elapsed, rss_before, rss_connected)
+        finally:
+            self.stop_server()
+
+    def report(self, elapsed: float, rss_before: Optional[int], rss_connected: Optional[int]):
+        stats = self.stats
+        lines = [
+            f"Clients: {stats.connected} connectés, {stats.failed} échecs, {stats.disconnected} déconnexions volontaires",
+            f"Salles: {self.args.rooms}, questions par partie: {self.args.questions}, durée: {elapsed:.1f}s",
+            f"Latence de diffusion des questions: {percentiles(stats.question_latency)}",
+            f"Aller-retour des réponses:          {percentiles(stats.answer_rtt)}",
+        ]
+        if stats.first_answer_at and stats.last_result_at and stats.last_result_at > stats.first_answer_at:
+            window = stats.last_result_at - stats.first_answer_at
+            lines.append(f"Réponses: {stats.answers_sent} envoyées, {stats.answers_correct} justes, "
+                         f"{len(stats.answer_rtt) / window:.0f} traitées/s")
+        lines.append(f"Frames reçus: {stats.frames} ({stats.bytes / 1024:.0f} Ko)")
+        if rss_before and rss_connected and stats.connected:
+            per_connection = (rss_connected - rss_before) / stats.connected
+            lines.append(f"Mémoire serveur: {rss_before / 1024:.1f} Mo au repos, "
+                         f"{rss_connected / 1024:.1f} Mo connectés, ~{per_connection:.1f} Ko par connexion")
+        report = "\n".join(lines)
+        print(report)
+        if self.args.output:
+            with open(self.args.output, "w", encoding="utf-8") as f:
+                f.write(report + "\n")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Banc de charge WebSocket du Party Game")
+    parser.add_argument("--clients", type=int, default=200, help="nombre de joueurs simulés")
+    parser.add_argument("--rooms", type=int, default=1, help="nombre de salles (joueurs répartis)")
+    parser.add_argument("--questions", type=int, default=5, help="questions par partie")
+    parser.add_argument("--question-duration", type=float, default=3, help="durée d'une question (s)")
+    parser.add_argument("--reveal-duration", type=float, default=1, help="durée de la révélation (s)")
+    parser.add_argument("--wrong-ratio", type=float, default=0.5, help="proportion de joueurs qui se trompent d'abord")
+    parser.add_argument("--disconnect-ratio", type=float, default=0.05, help="proportion de joueurs qui partent en cours de partie")
+    parser.add_argument("--connect-batch", type=int, default=50, help="connexions ouvertes par lot")
+    parser.add_argument("--timeout", type=float, default=300, help="durée max du bench (s)")
+    parser.add_argument("--database-url", help="base à utiliser (SQLite temporaire par défaut)")
+    parser.add_argument("--url", help="serveur déjà lancé (sinon démarré en local)")
+    parser.add_argument("--output", help="écrit aussi le rapport dans ce fichier (ex. bench_output.txt)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(Benchmark(parse_args()).run())
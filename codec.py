@@ -0,0 +1,102 @@
+"""Encodage des messages sortants : chaque frame n'est sérialisé qu'une fois par codec.
+
+Le codec est négocié à la connexion (`?codec=msgpack` ou sous-protocole WebSocket
+`msgpack`). Sans préférence, on utilise orjson s'il est installé, sinon le module
+`json` de la bibliothèque standard. orjson et json produisant le même texte, tous
+les clients JSON partagent le même encodage.
+"""
+import json
+from typing import Any, Dict, Optional, Tuple, Union
+
+from fastapi import WebSocket
+
+try:
+    import orjson
+except ImportError:  # dépendance optionnelle
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # dépendance optionnelle
+    msgpack = None
+
+
+class JsonCodec:
+    """Codec de secours basé sur la bibliothèque standard"""
+    name = "json"
+    binary = False
+
+    def encode(self, message: dict) -> str:
+        return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """Même format que JsonCodec, mais beaucoup plus rapide"""
+    name = "orjson"
+
+    def encode(self, message: dict) -> str:
+        return orjson.dumps(message).decode("utf-8")
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        return orjson.loads(data)
+
+
+class MsgpackCodec:
+    """Frames binaires MessagePack pour les clients qui le demandent"""
+    name = "msgpack"
+    binary = True
+
+    def encode(self, message: dict) -> bytes:
+        return msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        if isinstance(data, str):
+            return json.loads(data)
+        return msgpack.unpackb(data, raw=False)
+
+
+DEFAULT_CODEC = OrjsonCodec() if orjson is not None else JsonCodec()
+
+CODECS: Dict[str, Any] = {"json": DEFAULT_CODEC, DEFAULT_CODEC.name: DEFAULT_CODEC}
+if msgpack is not None:
+    CODECS["msgpack"] = MsgpackCodec()
+
+
+def negotiate_codec(websocket: WebSocket) -> Tuple[Any, Optional[str]]:
+    """Choisit le codec d'une connexion. Retourne (codec, sous-protocole à accepter)."""
+    offered = websocket.headers.get("sec-websocket-protocol", "")
+    for protocol in (p.strip() for p in offered.split(",") if p.strip()):
+        if protocol in CODECS:
+            return CODECS[protocol], protocol
+
+    requested = websocket.query_params.get("codec")
+    if requested in CODECS:
+        return CODECS[requested], None
+
+    return DEFAULT_CODEC, None
+
+
+class Frame:
+    """Message sortant partagé entre tous ses destinataires.
+
+    L'encodage est fait à la première demande pour un codec donné puis réutilisé.
+    """
+    __slots__ = ("message", "_encoded")
+
+    def __init__(self, message: dict):
+        self.message = message
+        self._encoded: Dict[str, Union[str, bytes]] = {}
+
+    @property
+    def type(self) -> str:
+        return self.message["type"]
+
+    def encode(self, codec) -> Union[str, bytes]:
+        payload = self._encoded.get(codec.name)
+        if payload is None:
+            payload = codec.encode(self.message)
+            self._encoded[codec.name] = payload
+        return payload
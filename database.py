@@ -1,9 +1,22 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Text, TIMESTAMP, func
+import asyncio
+import functools
+import hashlib
+import math
+import random
+import select
+import threading
+import time
+import uuid
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, Column, Integer, String, Text, TIMESTAMP, delete, func, insert, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List, Dict
+from typing import Iterable, List, Dict, Optional, Set, Tuple
+
+from metrics import db_call_seconds, timed
 
 # Récupérer l'URL de la base de données depuis les variables d'environnement
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -30,25 +43,206 @@ class QuestionDB(Base):
     answer = Column(String(500), nullable=False)
     created_at = Column(TIMESTAMP, server_default=func.now())
 
+# Index de recherche des doublons à l'import (find_existing_questions). Sur PostgreSQL,
+# une empreinte md5 : un index btree sur le texte brut refuse les valeurs de plus de ~2,7 Ko
+QUESTION_LOOKUP_INDEX = {
+    "postgresql": "CREATE INDEX IF NOT EXISTS questions_question_md5 ON questions (md5(question))",
+}.get(engine.dialect.name, "CREATE INDEX IF NOT EXISTS questions_question ON questions (question)")
+
 # Créer les tables si elles n'existent pas
 try:
     Base.metadata.create_all(bind=engine)
+    # create_all ne crée pas les index d'une table existante
+    with engine.begin() as conn:
+        conn.execute(text(QUESTION_LOOKUP_INDEX))
     print("✅ Base de données PostgreSQL connectée et tables initialisées")
 except Exception as e:
     raise RuntimeError(f"Impossible d'initialiser la base de données: {e}")
 
 
+# Cache mémoire des questions, partagé par tout le processus.
+# Les écritures le mettent à jour directement ; en multi-instances, on peut en plus
+# l'expirer après QUESTION_CACHE_TTL secondes ou l'invalider via NOTIFY (PostgreSQL,
+# activé par défaut avec BACKPLANE=postgres, c'est-à-dire dès qu'il y a plusieurs workers).
+QUESTION_CACHE_TTL = float(os.getenv("QUESTION_CACHE_TTL", "0"))  # 0 = jamais expiré
+QUESTION_CACHE_NOTIFY = (
+    os.getenv("QUESTION_CACHE_NOTIFY", "1" if os.getenv("BACKPLANE") == "postgres" else "0") == "1"
+    and engine.dialect.name == "postgresql"
+)
+QUESTION_CACHE_CHANNEL = "party_game_questions"
+
+
+class QuestionCache:
+    """Questions indexées par id, avec un numéro de version incrémenté à chaque changement"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_id: Optional[Dict[int, Dict]] = None
+        self._sorted: Optional[List[Dict]] = None
+        self._loaded_at = 0.0
+        self.version = 0
+        # Identifie ce processus dans les notifications d'invalidation
+        self.instance_id = uuid.uuid4().hex
+
+    def _expired(self) -> bool:
+        return QUESTION_CACHE_TTL > 0 and time.monotonic() - self._loaded_at > QUESTION_CACHE_TTL
+
+    def get_all(self) -> Optional[List[Dict]]:
+        """Liste triée par id, ou None si le cache doit être (re)chargé"""
+        with self._lock:
+            if self._by_id is None or self._expired():
+                return None
+            if self._sorted is None:
+                self._sorted = sorted(self._by_id.values(), key=lambda q: q["id"])
+            return list(self._sorted)
+
+    def page(self, after_id: int, limit: int) -> Optional[List[Dict]]:
+        """Jusqu'à `limit` questions d'id > `after_id` (bisection dans la liste triée), ou None"""
+        with self._lock:
+            if self._by_id is None or self._expired():
+                return None
+            if self._sorted is None:
+                self._sorted = sorted(self._by_id.values(), key=lambda q: q["id"])
+            start = bisect_right(self._sorted, after_id, key=lambda q: q["id"])
+            return self._sorted[start:start + limit]
+
+    def get(self, question_id: int) -> Optional[Dict]:
+        with self._lock:
+            if self._by_id is None or self._expired():
+                return None
+            return self._by_id.get(question_id)
+
+    def count(self) -> Optional[int]:
+        with self._lock:
+            if self._by_id is None or self._expired():
+                return None
+            return len(self._by_id)
+
+    def fill(self, questions: List[Dict], version: int) -> bool:
+        """Installe `questions`, lues alors que le cache était à la version `version`.
+        Refusé (False) si une écriture a eu lieu depuis : la lecture est peut-être périmée."""
+        with self._lock:
+            if self.version != version:
+                return False
+            self._by_id = {q["id"]: q for q in questions}
+            self._sorted = list(questions)
+            self._loaded_at = time.monotonic()
+            self.version += 1
+            return True
+
+    def put(self, question: Dict):
+        with self._lock:
+            if self._by_id is not None:
+                self._by_id[question["id"]] = question
+                self._sorted = None
+            self.version += 1
+
+    def put_many(self, questions: List[Dict]):
+        with self._lock:
+            if self._by_id is not None:
+                for question in questions:
+                    self._by_id[question["id"]] = question
+                self._sorted = None
+            self.version += 1
+
+    def remove(self, question_id: int):
+        with self._lock:
+            if self._by_id is not None:
+                self._by_id.pop(question_id, None)
+                self._sorted = None
+            self.version += 1
+
+    def remove_many(self, question_ids: Iterable[int]):
+        with self._lock:
+            if self._by_id is not None:
+                for question_id in question_ids:
+                    self._by_id.pop(question_id, None)
+                self._sorted = None
+            self.version += 1
+
+    def clear(self):
+        with self._lock:
+            self._by_id = {}
+            self._sorted = []
+            self._loaded_at = time.monotonic()
+            self.version += 1
+
+    def invalidate(self):
+        """Oublie tout : la prochaine lecture rechargera depuis la base"""
+        with self._lock:
+            self._by_id = None
+            self._sorted = None
+            self.version += 1
+
+
+question_cache = QuestionCache()
+
+
+def get_questions_version() -> int:
+    """Version courante de la banque de questions (change à chaque écriture)"""
+    return question_cache.version
+
+
+def get_questions_etag() -> str:
+    """ETag faible de la banque : version du cache, préfixée par l'instance (le compteur repart de 0 au démarrage)"""
+    return f'W/"{question_cache.instance_id[:8]}-{question_cache.version}"'
+
+
+def _notify_questions_changed(db):
+    """Prévient les autres instances (envoyé au commit de la transaction)"""
+    if QUESTION_CACHE_NOTIFY:
+        db.execute(text("SELECT pg_notify(:channel, :payload)"),
+                   {"channel": QUESTION_CACHE_CHANNEL, "payload": question_cache.instance_id})
+
+
+def _listen_questions_changed():
+    """Thread d'écoute des invalidations envoyées par les autres instances"""
+    while True:
+        try:
+            conn = engine.raw_connection()
+            dbapi_conn = conn.dbapi_connection
+            dbapi_conn.autocommit = True
+            with dbapi_conn.cursor() as cur:
+                cur.execute(f'LISTEN "{QUESTION_CACHE_CHANNEL}"')
+            while True:
+                if select.select([dbapi_conn], [], [], 60) == ([], [], []):
+                    continue
+                dbapi_conn.poll()
+                while dbapi_conn.notifies:
+                    notify = dbapi_conn.notifies.pop(0)
+                    if notify.payload != question_cache.instance_id:
+                        question_cache.invalidate()
+        except Exception as e:
+            print(f"❌ Écoute des invalidations du cache interrompue: {e}")
+            question_cache.invalidate()
+            time.sleep(5)
+
+
+if QUESTION_CACHE_NOTIFY:
+    threading.Thread(target=_listen_questions_changed, name="question-cache-listener", daemon=True).start()
+
+
+def _question_to_dict(q: QuestionDB) -> Dict:
+    return {"id": q.id, "image": q.image, "question": q.question, "answer": q.answer}
+
+
 # Fonctions CRUD pour les questions (DB uniquement)
+@timed(db_call_seconds)
 def load_questions() -> List[Dict]:
-    """Charge toutes les questions depuis PostgreSQL et retourne une liste de dicts"""
+    """Retourne toutes les questions (triées par id) depuis le cache, ou depuis PostgreSQL
+    si le cache est vide ou expiré. Les dicts sont partagés : ne pas les modifier."""
+    cached = question_cache.get_all()
+    if cached is not None:
+        return cached
+
+    # Version relevée avant la lecture : une écriture pendant le SELECT empêche de remplir le cache
+    version = question_cache.version
     db = SessionLocal()
     try:
         questions_db = db.query(QuestionDB).order_by(QuestionDB.id).all()
-        questions = [
-            {"id": q.id, "image": q.image, "question": q.question, "answer": q.answer}
-            for q in questions_db
-        ]
-        return questions
+        questions = [_question_to_dict(q) for q in questions_db]
+        question_cache.fill(questions, version)
+        return list(questions)
     except SQLAlchemyError as e:
         db.rollback()
         print(f"❌ Erreur lors du chargement des questions: {e}")
@@ -57,15 +251,20 @@ def load_questions() -> List[Dict]:
         db.close()
 
 
+@timed(db_call_seconds)
 def save_question(image: str, question_text: str, answer: str) -> Dict | None:
     """Sauvegarde une nouvelle question dans PostgreSQL et retourne l'objet créé sous forme de dict"""
     db = SessionLocal()
     try:
         new_question = QuestionDB(image=image, question=question_text, answer=answer)
         db.add(new_question)
+        db.flush()
+        _notify_questions_changed(db)
         db.commit()
         db.refresh(new_question)
-        return {"id": new_question.id, "image": new_question.image, "question": new_question.question, "answer": new_question.answer}
+        question = _question_to_dict(new_question)
+        question_cache.put(question)
+        return question
     except SQLAlchemyError as e:
         db.rollback()
         print(f"❌ Erreur lors de l'ajout de la question: {e}")
@@ -74,6 +273,7 @@ def save_question(image: str, question_text: str, answer: str) -> Dict | None:
         db.close()
 
 
+@timed(db_call_seconds)
 def delete_question(question_id: int) -> bool:
     """Supprime une question par son ID. Retourne True si supprimée."""
     db = SessionLocal()
@@ -82,7 +282,9 @@ def delete_question(question_id: int) -> bool:
         if not question:
             return False
         db.delete(question)
+        _notify_questions_changed(db)
         db.commit()
+        question_cache.remove(question_id)
         return True
     except SQLAlchemyError as e:
         db.rollback()
@@ -92,12 +294,85 @@ def delete_question(question_id: int) -> bool:
         db.close()
 
 
+# Nombre de lignes par requête dans les opérations groupées
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "500"))
+
+
+@timed(db_call_seconds)
+def save_questions(questions: List[Dict], fill_cache: bool = True) -> List[Dict]:
+    """Insère plusieurs questions ({"image", "question", "answer"}) en une transaction,
+    par lots de BULK_BATCH_SIZE lignes (INSERT ... RETURNING). Retourne les questions créées
+    dans l'ordre reçu, ou une liste vide en cas d'erreur (rien n'est inséré).
+    `fill_cache=False` (imports) invalide le cache au lieu d'y ajouter les questions."""
+    if not questions:
+        return []
+    db = SessionLocal()
+    try:
+        stmt = insert(QuestionDB).returning(
+            QuestionDB.id, QuestionDB.image, QuestionDB.question, QuestionDB.answer,
+            sort_by_parameter_order=True
+        )
+        created = []
+        for start in range(0, len(questions), BULK_BATCH_SIZE):
+            rows = [
+                {"image": q["image"], "question": q["question"], "answer": q["answer"]}
+                for q in questions[start:start + BULK_BATCH_SIZE]
+            ]
+            created.extend(row._asdict() for row in db.execute(stmt, rows))
+        _notify_questions_changed(db)
+        db.commit()
+        if fill_cache:
+            question_cache.put_many(created)
+        else:
+            question_cache.invalidate()
+        return created
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"❌ Erreur lors de l'ajout groupé des questions: {e}")
+        return []
+    finally:
+        db.close()
+
+
+@timed(db_call_seconds)
+def delete_questions(question_ids: Iterable[int]) -> int:
+    """Supprime plusieurs questions en une transaction (DELETE ... WHERE id IN, par lots).
+    Retourne le nombre de questions supprimées."""
+    question_ids = list(dict.fromkeys(question_ids))
+    if not question_ids:
+        return 0
+    db = SessionLocal()
+    try:
+        deleted = 0
+        for start in range(0, len(question_ids), BULK_BATCH_SIZE):
+            batch = question_ids[start:start + BULK_BATCH_SIZE]
+            result = db.execute(delete(QuestionDB).where(QuestionDB.id.in_(batch)))
+            deleted += result.rowcount
+        _notify_questions_changed(db)
+        db.commit()
+        question_cache.remove_many(question_ids)
+        return deleted
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"❌ Erreur lors de la suppression groupée: {e}")
+        return 0
+    finally:
+        db.close()
+
+
+@timed(db_call_seconds)
 def delete_all_questions() -> bool:
-    """Supprime toutes les questions (utilitaire)."""
+    """Supprime toutes les questions en une requête (TRUNCATE sur PostgreSQL).
+    Les ids ne sont pas réinitialisés : une nouvelle question n'est jamais prise pour une déjà posée."""
     db = SessionLocal()
     try:
-        db.query(QuestionDB).delete()
+        if engine.dialect.name == "postgresql":
+            db.execute(text(f"TRUNCATE TABLE {QuestionDB.__tablename__}"))
+        else:
+            db.execute(delete(QuestionDB))
+        _notify_questions_changed(db)
         db.commit()
+        question_cache.clear()
         return True
     except SQLAlchemyError as e:
         db.rollback()
@@ -105,3 +380,240 @@ def delete_all_questions() -> bool:
         return False
     finally:
         db.close()
+
+
+@timed(db_call_seconds)
+def load_questions_page(after_id: int = 0, limit: int = 1000) -> List[Dict]:
+    """Questions d'id > `after_id`, triées par id (pagination par clé, sans OFFSET).
+    Une erreur de la base est propagée : une page vide signifie toujours la fin."""
+    db = SessionLocal()
+    try:
+        rows = (db.query(QuestionDB.id, QuestionDB.image, QuestionDB.question, QuestionDB.answer)
+                .filter(QuestionDB.id > after_id).order_by(QuestionDB.id).limit(limit).all())
+        return [row._asdict() for row in rows]
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"❌ Erreur lors du chargement des questions après {after_id}: {e}")
+        raise
+    finally:
+        db.close()
+
+
+@timed(db_call_seconds)
+def get_questions_page(after_id: int = 0, limit: int = 100) -> List[Dict]:
+    """Comme load_questions_page, mais servi par le cache (chargé au besoin). Dicts partagés."""
+    page = question_cache.page(after_id, limit)
+    if page is None:
+        load_questions()
+        page = question_cache.page(after_id, limit)
+    return page if page is not None else load_questions_page(after_id, limit)
+
+
+@timed(db_call_seconds)
+def find_existing_questions(questions: List[Dict]) -> Set[Tuple[str, str]]:
+    """Couples (question, réponse) de `questions` déjà présents en base (via QUESTION_LOOKUP_INDEX).
+    Une erreur de la base est propagée : sans elle, les doublons seraient insérés sans prévenir."""
+    texts = list({q["question"] for q in questions})
+    hashed = engine.dialect.name == "postgresql"
+    existing: Set[Tuple[str, str]] = set()
+    if not texts:
+        return existing
+    db = SessionLocal()
+    try:
+        for start in range(0, len(texts), BULK_BATCH_SIZE):
+            batch = texts[start:start + BULK_BATCH_SIZE]
+            if hashed:
+                digests = [hashlib.md5(t.encode("utf-8")).hexdigest() for t in batch]
+                condition = func.md5(QuestionDB.question).in_(digests)
+            else:
+                condition = QuestionDB.question.in_(batch)
+            rows = db.query(QuestionDB.question, QuestionDB.answer).filter(condition)
+            existing.update((row.question, row.answer) for row in rows)
+        return existing
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"❌ Erreur lors de la recherche des doublons: {e}")
+        raise
+    finally:
+        db.close()
+
+
+# En dessous de cette plage d'ids, un tri aléatoire de toute la table reste bon marché
+SAMPLE_SORT_MAX = int(os.getenv("SAMPLE_SORT_MAX", "5000"))
+# Tours de tirage d'ids au hasard avant de se rabattre sur le tri aléatoire
+SAMPLE_ROUNDS = 4
+
+
+def _sample_by_sort(db, limit: int, exclude_ids: Set[int]) -> List[int]:
+    """ORDER BY random() : parcourt et trie toute la table"""
+    query = db.query(QuestionDB.id)
+    if exclude_ids:
+        query = query.filter(QuestionDB.id.notin_(list(exclude_ids)))
+    query = query.order_by(func.random())
+    if limit > 0:
+        query = query.limit(limit)
+    return [row[0] for row in query.all()]
+
+
+@timed(db_call_seconds)
+def sample_question_ids(limit: int, exclude_ids: Iterable[int] = ()) -> List[int]:
+    """Tire au hasard, côté base, jusqu'à `limit` ids de questions non exclues (0 = toutes).
+
+    Des ids sont tirés au hasard entre le plus petit et le plus grand id, puis ceux qui
+    existent sont retrouvés par la clé primaire : le coût ne dépend pas de la taille de
+    la banque. Petite table, tirage complet ou banque presque épuisée : tri aléatoire."""
+    exclude = set(exclude_ids)
+    db = SessionLocal()
+    try:
+        low, high = db.query(func.min(QuestionDB.id), func.max(QuestionDB.id)).one()
+        if low is None:
+            return []
+        span = high - low + 1
+        if limit <= 0 or span <= SAMPLE_SORT_MAX or limit + len(exclude) > span // 2:
+            return _sample_by_sort(db, limit, exclude)
+
+        picked: List[int] = []
+        tried = set(exclude)
+        hit_rate = 1.0
+        for _ in range(SAMPLE_ROUNDS):
+            # Assez de candidats pour compenser les trous dans les ids (suppressions)
+            wanted = math.ceil((limit - len(picked)) / hit_rate * 1.5) + 10
+            candidates = list({random.randint(low, high) for _ in range(min(wanted, span))} - tried)
+            tried.update(candidates)
+            found: Set[int] = set()
+            for start in range(0, len(candidates), BULK_BATCH_SIZE):
+                batch = candidates[start:start + BULK_BATCH_SIZE]
+                found.update(row[0] for row in db.query(QuestionDB.id).filter(QuestionDB.id.in_(batch)))
+            hit_rate = max(len(found) / max(len(candidates), 1), 0.01)
+            new_ids = [c for c in candidates if c in found]
+            random.shuffle(new_ids)
+            picked.extend(new_ids[:limit - len(picked)])
+            if len(picked) >= limit:
+                return picked
+        # Ids trop clairsemés : compléter par le tri aléatoire
+        return picked + _sample_by_sort(db, limit - len(picked), exclude | set(picked))
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"❌ Erreur lors du tirage des questions: {e}")
+        return []
+    finally:
+        db.close()
+
+
+@timed(db_call_seconds)
+def get_questions_by_ids(question_ids: List[int]) -> List[Dict]:
+    """Retourne les questions demandées dans le même ordre (servies par le cache si possible).
+    Les ids introuvables sont ignorés ; une erreur de la base est propagée (SQLAlchemyError),
+    pour ne pas confondre une panne passagère avec des questions supprimées."""
+    found: Dict[int, Dict] = {}
+    missing = []
+    for question_id in question_ids:
+        question = question_cache.get(question_id)
+        if question is not None:
+            found[question_id] = question
+        else:
+            missing.append(question_id)
+
+    if missing:
+        db = SessionLocal()
+        try:
+            for q in db.query(QuestionDB).filter(QuestionDB.id.in_(missing)).all():
+                found[q.id] = _question_to_dict(q)
+        except SQLAlchemyError as e:
+            db.rollback()
+            print(f"❌ Erreur lors du chargement des questions {missing}: {e}")
+            raise
+        finally:
+            db.close()
+
+    return [found[i] for i in question_ids if i in found]
+
+
+@timed(db_call_seconds)
+def count_questions() -> int:
+    """Nombre de questions, servi par le cache quand il est chargé (sinon SELECT count(*))"""
+    count = question_cache.count()
+    if count is not None:
+        return count
+    db = SessionLocal()
+    try:
+        return db.query(func.count(QuestionDB.id)).scalar() or 0
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"❌ Erreur lors du comptage des questions: {e}")
+        return 0
+    finally:
+        db.close()
+
+
+# Versions asynchrones : les appels à la base tournent dans un pool de threads dédié
+# pour ne jamais bloquer la boucle d'événements (timers, broadcasts...).
+DB_THREADS = int(os.getenv("DB_THREADS", "8"))
+_db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
+
+
+async def _run_in_db_thread(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def aload_questions() -> List[Dict]:
+    """Version asynchrone de load_questions (sans thread si le cache est chaud)"""
+    cached = question_cache.get_all()
+    if cached is not None:
+        return cached
+    return await _run_in_db_thread(load_questions)
+
+
+async def asave_question(image: str, question_text: str, answer: str) -> Dict | None:
+    return await _run_in_db_thread(save_question, image=image, question_text=question_text, answer=answer)
+
+
+async def adelete_question(question_id: int) -> bool:
+    return await _run_in_db_thread(delete_question, question_id)
+
+
+async def asave_questions(questions: List[Dict], fill_cache: bool = True) -> List[Dict]:
+    return await _run_in_db_thread(save_questions, questions, fill_cache)
+
+
+async def adelete_questions(question_ids: Iterable[int]) -> int:
+    return await _run_in_db_thread(delete_questions, list(question_ids))
+
+
+async def adelete_all_questions() -> bool:
+    return await _run_in_db_thread(delete_all_questions)
+
+
+async def aload_questions_page(after_id: int = 0, limit: int = 1000) -> List[Dict]:
+    return await _run_in_db_thread(load_questions_page, after_id, limit)
+
+
+async def aget_questions_page(after_id: int = 0, limit: int = 100) -> List[Dict]:
+    """Version asynchrone de get_questions_page (sans thread si le cache est chaud)"""
+    page = question_cache.page(after_id, limit)
+    if page is not None:
+        return page
+    return await _run_in_db_thread(get_questions_page, after_id, limit)
+
+
+async def afind_existing_questions(questions: List[Dict]) -> Set[Tuple[str, str]]:
+    return await _run_in_db_thread(find_existing_questions, questions)
+
+
+async def asample_question_ids(limit: int, exclude_ids: Iterable[int] = ()) -> List[int]:
+    return await _run_in_db_thread(sample_question_ids, limit, list(exclude_ids))
+
+
+async def aget_questions_by_ids(question_ids: List[int]) -> List[Dict]:
+    cached = [question_cache.get(i) for i in question_ids]
+    if all(q is not None for q in cached):
+        return cached
+    return await _run_in_db_thread(get_questions_by_ids, question_ids)
+
+
+async def acount_questions() -> int:
+    count = question_cache.count()
+    if count is not None:
+        return count
+    return await _run_in_db_thread(count_questions)
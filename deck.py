@@ -0,0 +1,71 @@
+"""Paquet de questions d'une partie.
+
+Au démarrage, seuls les ids sont tirés au hasard par la base ; le contenu des
+questions est chargé à la demande, avec une ou deux questions d'avance.
+"""
+import asyncio
+import logging
+import os
+from typing import Dict, Iterable, List, Optional
+
+from database import asample_question_ids, aget_questions_by_ids
+from models import Question
+
+# Nombre de questions tirées par partie (0 = toutes les questions disponibles)
+QUESTIONS_PER_GAME = int(os.getenv("QUESTIONS_PER_GAME", "50"))
+# Nombre de questions chargées à l'avance
+DECK_LOOKAHEAD = int(os.getenv("DECK_LOOKAHEAD", "2"))
+
+
+class QuestionDeck:
+    def __init__(self, question_ids: List[int]):
+        self.ids = list(question_ids)
+        self._bodies: Dict[int, Question] = {}
+        self._prefetch: Optional[asyncio.Task] = None
+
+    @classmethod
+    async def draw(cls, exclude_ids: Iterable[int] = (), size: int = QUESTIONS_PER_GAME) -> "QuestionDeck":
+        """Nouveau paquet de questions jamais posées, dans un ordre aléatoire"""
+        return cls(await asample_question_ids(size, exclude_ids))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def peek(self, index: int) -> Optional[Question]:
+        """Question déjà chargée à cette position, sans accès à la base"""
+        if 0 <= index < len(self.ids):
+            return self._bodies.get(self.ids[index])
+        return None
+
+    async def load(self, index: int) -> Optional[Question]:
+        """Charge la question à cette position (et les suivantes en tâche de fond).
+        Les questions supprimées entre-temps sont retirées du paquet. Une erreur de la base
+        est propagée sans toucher au paquet."""
+        while 0 <= index < len(self.ids):
+            question_id = self.ids[index]
+            if question_id not in self._bodies:
+                await self._fetch(self.ids[index:index + 1 + DECK_LOOKAHEAD])
+            question = self._bodies.get(question_id)
+            if question is not None:
+                self._schedule_prefetch(index + 1)
+                return question
+            del self.ids[index]
+        return None
+
+    async def _fetch(self, question_ids: List[int]):
+        wanted = [i for i in question_ids if i not in self._bodies]
+        if wanted:
+            for row in await aget_questions_by_ids(wanted):
+                self._bodies[row["id"]] = Question.from_dict(row)
+
+    def _schedule_prefetch(self, start: int):
+        upcoming = [i for i in self.ids[start:start + DECK_LOOKAHEAD] if i not in self._bodies]
+        if not upcoming or (self._prefetch is not None and not self._prefetch.done()):
+            return
+        self._prefetch = asyncio.create_task(self._prefetch_quietly(upcoming))
+
+    async def _prefetch_quietly(self, question_ids: List[int]):
+        try:
+            await self._fetch(question_ids)
+        except Exception:
+            logging.exception("Préchargement des questions impossible")
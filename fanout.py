@@ -0,0 +1,229 @@
+"""Diffusion des messages vers les WebSockets sans bloquer sur le client le plus lent.
+
+Chaque connexion possède sa propre file sortante bornée et une tâche d'écriture
+dédiée : `broadcast` ne fait que déposer le frame dans les files et rend la main
+immédiatement. Les frames "remplaçables" (ex. un `ready_status` plus récent
+rend le précédent inutile) sont fusionnés, et un client qui accumule trop de retard
+est déconnecté.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Set
+
+from fastapi import WebSocket
+
+from codec import DEFAULT_CODEC, Frame
+from metrics import client_evictions_total
+
+# Taille max de la file sortante d'un client avant éviction
+OUTBOUND_QUEUE_SIZE = int(os.getenv("OUTBOUND_QUEUE_SIZE", "256"))
+# Retard max (secondes) du plus vieux frame en attente avant éviction
+MAX_CLIENT_LAG = float(os.getenv("MAX_CLIENT_LAG", "5"))
+
+# Code de fermeture d'une socket remplacée par une connexion plus récente du même joueur
+# (le client ne se reconnecte pas automatiquement)
+SUPERSEDED_CLOSE_CODE = 4000
+
+# Types de messages dont seule la dernière version compte
+COALESCED_TYPES = {"ready_status"}
+# Intervalle (ms) de regroupement des mises à jour non urgentes d'une salle (0 = envoi immédiat)
+BROADCAST_TICK = float(os.getenv("BROADCAST_TICK_MS", "75")) / 1000
+
+
+class _Outbound:
+    """Entrée de la file sortante (mutable pour pouvoir être périmée sur place)."""
+    __slots__ = ("key", "frame", "enqueued_at")
+
+    def __init__(self, key: Optional[str], frame: Frame):
+        self.key = key
+        self.frame: Optional[Frame] = frame
+        self.enqueued_at = time.monotonic()
+
+
+class ClientConnection:
+    """Une WebSocket avec sa file sortante et sa tâche d'écriture."""
+
+    def __init__(self, websocket: WebSocket, player_id: str,
+                 on_evict: Callable[["ClientConnection"], Awaitable[None]],
+                 max_queue: int = OUTBOUND_QUEUE_SIZE,
+                 max_lag: float = MAX_CLIENT_LAG,
+                 codec=DEFAULT_CODEC):
+        self.websocket = websocket
+        self.player_id = player_id
+        self.codec = codec
+        self._on_evict = on_evict
+        self._max_queue = max_queue
+        self._max_lag = max_lag
+        self._queue: Deque[_Outbound] = deque()
+        # Dernière entrée en attente pour chaque clé de fusion
+        self._pending: Dict[str, _Outbound] = {}
+        self._wakeup = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        # Fermeture après éviction (référence gardée jusqu'à la fin)
+        self._closer: Optional[asyncio.Task] = None
+        self.closed = False
+        # Dernier message reçu du client (heartbeat)
+        self.last_seen = time.monotonic()
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def send(self, frame: Frame, key: Optional[str] = None):
+        """Dépose un frame dans la file sans attendre l'envoi réseau."""
+        if self.closed:
+            return
+
+        if key is not None:
+            stale = self._pending.get(key)
+            if stale is not None:
+                # Le nouveau frame remplace l'ancien qui n'est pas encore parti
+                stale.frame = None
+
+        entry = _Outbound(key, frame)
+        self._queue.append(entry)
+        if key is not None:
+            self._pending[key] = entry
+
+        if self._is_lagging():
+            self.evict("file sortante saturée")
+            return
+
+        self._wakeup.set()
+
+    def _is_lagging(self) -> bool:
+        if len(self._queue) > self._max_queue:
+            return True
+        # Ignorer les entrées périmées en tête pour mesurer le vrai retard
+        while self._queue and self._queue[0].frame is None:
+            self._queue.popleft()
+        if self._queue:
+            return time.monotonic() - self._queue[0].enqueued_at > self._max_lag
+        return False
+
+    async def _write_loop(self):
+        try:
+            while True:
+                if not self._queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                entry = self._queue.popleft()
+                if entry.key is not None and self._pending.get(entry.key) is entry:
+                    del self._pending[entry.key]
+                if entry.frame is None:
+                    continue
+
+                # Encodé une seule fois par codec, partagé avec les autres clients
+                payload = entry.frame.encode(self.codec)
+                if self.codec.binary:
+                    await self.websocket.send_bytes(payload)
+                else:
+                    await self.websocket.send_text(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Socket morte : on laisse le chemin normal de déconnexion faire le ménage
+            logging.info(f"Writer {self.player_id} arrêté: {e}")
+            self.evict("erreur d'envoi")
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    @property
+    def pending(self) -> int:
+        """Nombre de frames en attente d'envoi"""
+        return len(self._queue)
+
+    def evict(self, reason: str, code: int = 1013):
+        """Ferme la connexion d'un client trop lent (ou muet) et prévient le gestionnaire."""
+        if self.closed:
+            return
+        logging.warning(f"Éviction du joueur {self.player_id}: {reason}")
+        client_evictions_total.labels(reason).inc()
+        self.close()
+        self._closer = asyncio.create_task(self._close_and_notify(code))
+
+    def supersede(self):
+        """Le joueur s'est reconnecté ailleurs (autre onglet) : fermer cette socket sans le déconnecter"""
+        if self.closed:
+            return
+        self.close()
+        self._closer = asyncio.create_task(self._close_socket(SUPERSEDED_CLOSE_CODE))
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def _close_and_notify(self, code: int):
+        await self._close_socket(code)
+        await self._on_evict(self)
+
+    def close(self):
+        """Arrête la tâche d'écriture et vide la file."""
+        self.closed = True
+        self._queue.clear()
+        self._pending.clear()
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+
+class BroadcastScheduler:
+    """Regroupe les mises à jour non urgentes d'une salle (classement, statut prêt).
+
+    Au lieu de diffuser à chaque réponse, on marque l'état comme "sale" et on envoie
+    une seule mise à jour par tick. Les messages construits au moment de l'envoi
+    reflètent donc l'état le plus récent. Les frames urgents (question, révélation,
+    résultat d'une réponse) ne passent pas par ici.
+    """
+
+    def __init__(self, flushers: Dict[str, Callable[[bool], Awaitable[None]]], tick: float = BROADCAST_TICK):
+        self._flushers = flushers
+        self._tick = tick
+        # Type de mise à jour -> faut-il aussi la relayer aux autres workers
+        self._dirty: Dict[str, bool] = {}
+        self._handle: Optional[asyncio.TimerHandle] = None
+        # Envois groupés en cours (référence gardée : la boucle ne garde les tâches que faiblement)
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def request(self, kind: str, forward: bool = True):
+        if self._tick <= 0:
+            await self._flushers[kind](forward)
+            return
+        self._dirty[kind] = self._dirty.get(kind, False) or forward
+        if self._handle is None:
+            loop = asyncio.get_running_loop()
+            self._handle = loop.call_later(self._tick, self._start_flush)
+
+    def _start_flush(self):
+        self._handle = None
+        task = asyncio.create_task(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self):
+        """Envoie tout ce qui est en attente"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        dirty, self._dirty = self._dirty, {}
+        for kind, forward in dirty.items():
+            try:
+                await self._flushers[kind](forward)
+            except Exception:
+                logging.exception(f"Erreur lors de l'envoi groupé ({kind})")
+
+    def cancel(self):
+        """Abandonne les envois en attente (salle réinitialisée ou supprimée)"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        for task in list(self._tasks):
+            if task is not asyncio.current_task():
+                task.cancel()
+        self._dirty.clear()
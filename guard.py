@@ -0,0 +1,132 @@
+"""Contrôle des messages WebSocket entrants.
+
+Chaque connexion a son `InboundGuard` : taille max d'un frame, validation du
+schéma de chaque type de message, et un seau à jetons par type pour borner le
+débit (ex. 5 réponses/s). Un message refusé est ignoré et coûte une pénalité ;
+un client qui épuise son crédit de pénalités (ou envoie un frame trop gros) est
+déconnecté avec le code 1008.
+"""
+import os
+import time
+from typing import Annotated, Dict, Literal, Optional, Tuple, Union
+
+from pydantic import BaseModel, Field, StringConstraints, TypeAdapter, ValidationError, field_validator
+
+from metrics import inbound_rejected_total
+
+# Longueur max d'un nom de joueur (au-delà, le nom est tronqué)
+NAME_MAX_LENGTH = 32
+# Taille max d'un message entrant (caractères pour le texte, octets pour le binaire)
+WS_MAX_FRAME_BYTES = int(os.getenv("WS_MAX_FRAME_BYTES", "4096"))
+# Pénalités tolérées d'affilée, et pénalités pardonnées par seconde
+GUARD_MAX_STRIKES = int(os.getenv("GUARD_MAX_STRIKES", "20"))
+GUARD_STRIKE_DECAY = float(os.getenv("GUARD_STRIKE_DECAY", "1"))
+
+# Débit autorisé par type de message : (jetons par seconde, rafale max)
+RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "answer": (5, 10),
+    "set_name": (0.5, 3),
+    "ready": (2, 5),
+    "image_loaded": (2, 5),
+    "disconnect_inactive": (0.1, 1),
+    "pong": (1, 3),
+}
+
+
+class AnswerMessage(BaseModel):
+    type: Literal["answer"]
+    answer: Annotated[str, StringConstraints(max_length=200)]
+
+
+class SetNameMessage(BaseModel):
+    type: Literal["set_name"]
+    name: Annotated[str, StringConstraints(strip_whitespace=True, min_length=1, max_length=200)]
+
+    @field_validator("name")
+    @classmethod
+    def truncate(cls, name: str) -> str:
+        # Un nom trop long est raccourci plutôt que refusé (le client l'afficherait quand même)
+        return name[:NAME_MAX_LENGTH].rstrip()
+
+
+class ReadyMessage(BaseModel):
+    type: Literal["ready"]
+
+
+class ImageLoadedMessage(BaseModel):
+    type: Literal["image_loaded"]
+    question_number: int = Field(ge=1)
+    load_ms: float = Field(default=0, ge=0, le=600_000)
+    source: Literal["prefetch", "question"] = "prefetch"
+
+
+class PongMessage(BaseModel):
+    type: Literal["pong"]
+
+
+class DisconnectInactiveMessage(BaseModel):
+    type: Literal["disconnect_inactive"]
+    reason: Optional[str] = None
+
+
+InboundMessage = Annotated[
+    Union[AnswerMessage, SetNameMessage, ReadyMessage, ImageLoadedMessage, PongMessage, DisconnectInactiveMessage],
+    Field(discriminator="type")
+]
+_inbound_adapter = TypeAdapter(InboundMessage)
+
+
+class AbusiveClient(Exception):
+    pass
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def consume(self, amount: float = 1) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+
+class InboundGuard:
+    def __init__(self, limits: Dict[str, Tuple[float, float]] = RATE_LIMITS,
+                 max_frame_bytes: int = WS_MAX_FRAME_BYTES):
+        self.max_frame_bytes = max_frame_bytes
+        self.buckets = {kind: TokenBucket(rate, burst) for kind, (rate, burst) in limits.items()}
+        self.strikes = TokenBucket(GUARD_STRIKE_DECAY, GUARD_MAX_STRIKES)
+
+    def parse(self, data, codec):
+        """Message validé, ou None s'il doit être ignoré. Lève AbusiveClient s'il faut déconnecter."""
+        if len(data) > self.max_frame_bytes:
+            self._reject("too_large", fatal=True)
+        try:
+            if codec.binary:
+                message = _inbound_adapter.validate_python(codec.decode(data))
+            else:
+                # Parsing et validation en une passe, sans json.loads
+                message = _inbound_adapter.validate_json(data)
+        except (ValidationError, ValueError):
+            self._reject("invalid")
+            return None
+
+        bucket = self.buckets.get(message.type)
+        if bucket is not None and not bucket.consume():
+            self._reject("rate_limited")
+            return None
+        return message
+
+    def _reject(self, reason: str, fatal: bool = False):
+        inbound_rejected_total.labels(reason).inc()
+        if fatal or not self.strikes.consume():
+            raise AbusiveClient(reason)
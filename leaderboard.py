@@ -0,0 +1,126 @@
+"""Classement maintenu incrémentalement.
+
+Les joueurs sont gardés triés par score (recherche par bisection) au fil des
+changements, au lieu de retrier toute la liste à chaque réponse. Les entrées
+modifiées depuis le dernier envoi sont accumulées pour produire des messages
+`leaderboard_delta` compacts ; le classement complet (`leaderboard_update`) n'est
+envoyé qu'à l'arrivée d'un joueur ou pour une resynchronisation.
+"""
+import os
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Set, Tuple
+
+from models import Player
+
+# Nombre d'entrées envoyées dans un classement complet (0 = tout le monde)
+LEADERBOARD_TOP_K = int(os.getenv("LEADERBOARD_TOP_K", "100"))
+
+# Clé de tri : (-score, ordre d'arrivée, id) pour départager les égalités de façon stable
+SortKey = Tuple[int, int, str]
+
+
+class Leaderboard:
+    def __init__(self):
+        self._order: List[SortKey] = []
+        self._keys: Dict[str, SortKey] = {}
+        self._players: Dict[str, Player] = {}
+        self._arrivals = 0
+        self._changed: Set[str] = set()
+        self._removed: Set[str] = set()
+        self._clear_answers = False
+
+    def __len__(self) -> int:
+        return len(self._players)
+
+    def add(self, player_id: str, player: Player, track: bool = True):
+        """Ajoute (ou remplace) un joueur. `player` est l'objet d'état du joueur, partagé."""
+        if player_id in self._players:
+            self._players[player_id] = player
+            self.update(player_id, track)
+            return
+        self._arrivals += 1
+        key = (-player.score, self._arrivals, player_id)
+        self._players[player_id] = player
+        self._keys[player_id] = key
+        insort(self._order, key)
+        if track:
+            self._removed.discard(player_id)
+            self._changed.add(player_id)
+
+    def update(self, player_id: str, track: bool = True):
+        """À appeler après avoir modifié le joueur (score, nom, réponse...)"""
+        player = self._players.get(player_id)
+        if player is None:
+            return
+        key = self._keys[player_id]
+        if -key[0] != player.score:
+            del self._order[bisect_left(self._order, key)]
+            key = (-player.score, key[1], player_id)
+            self._keys[player_id] = key
+            insort(self._order, key)
+        if track:
+            self._changed.add(player_id)
+
+    def remove(self, player_id: str, track: bool = True):
+        key = self._keys.pop(player_id, None)
+        if key is None:
+            return
+        del self._order[bisect_left(self._order, key)]
+        del self._players[player_id]
+        self._changed.discard(player_id)
+        if track:
+            self._removed.add(player_id)
+
+    def rebuild(self):
+        """Retrie tout après un changement global (ex. reset des scores) et oublie les changements"""
+        self._order = []
+        for player_id, player in self._players.items():
+            key = (-player.score, self._keys[player_id][1], player_id)
+            self._keys[player_id] = key
+            self._order.append(key)
+        self._order.sort()
+        self._changed.clear()
+        self._removed.clear()
+        self._clear_answers = False
+
+    def clear_answers(self):
+        """Les dernières réponses de tous les joueurs ont été effacées (nouvelle question)"""
+        self._clear_answers = True
+
+    def rank(self, player_id: str) -> Optional[int]:
+        """Rang du joueur (1 = premier)"""
+        key = self._keys.get(player_id)
+        if key is None:
+            return None
+        return bisect_left(self._order, key) + 1
+
+    def entry(self, player_id: str) -> dict:
+        return self._players[player_id].leaderboard_entry(player_id)
+
+    def top(self, k: int = LEADERBOARD_TOP_K) -> List[dict]:
+        keys = self._order[:k] if k > 0 else self._order
+        return [self.entry(key[2]) for key in keys]
+
+    def snapshot_message(self) -> dict:
+        return {
+            "type": "leaderboard_update",
+            "leaderboard": self.top(),
+            "total": len(self._players)
+        }
+
+    def take_delta(self) -> Optional[dict]:
+        """Message `leaderboard_delta` des changements depuis le dernier appel (None si rien)"""
+        if not self._changed and not self._removed and not self._clear_answers:
+            return None
+        message = {
+            "type": "leaderboard_delta",
+            "changed": [self.entry(player_id) for player_id in self._changed],
+            "removed": list(self._removed),
+            "total": len(self._players)
+        }
+        if self._clear_answers:
+            message["clear_answers"] = True
+        self._changed.clear()
+        self._removed.clear()
+        self._clear_answers = False
+        return message
@@ -1,21 +1,50 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, File, UploadFile, Body, Request
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Body, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict
-from pydantic import BaseModel
-import json
+from typing import Deque, Dict, Optional, Set, Tuple
+from contextlib import asynccontextmanager
 import asyncio
 import os
-import shutil
-from pathlib import Path
 import logging
 import cloudinary
-import cloudinary.uploader
-import random
+import math
+import re
+import time
+import uuid
+from collections import deque
 
 # ✨ NOUVEAU : Import de la gestion de la base de données
-from database import load_questions as db_load_questions, save_question as db_save_question, delete_question as db_delete_question
+from database import (
+    aload_questions as db_load_questions,
+    asave_question as db_save_question,
+    adelete_question as db_delete_question,
+    adelete_questions as db_delete_questions,
+    adelete_all_questions as db_delete_all_questions,
+    acount_questions as db_count_questions,
+    aget_questions_page as db_get_questions_page,
+    get_questions_etag,
+)
+from fanout import BroadcastScheduler, ClientConnection, COALESCED_TYPES
+from codec import DEFAULT_CODEC, Frame, negotiate_codec
+from backplane import Backplane, create_backplane
+from deck import QuestionDeck
+from guard import AbusiveClient, InboundGuard, WS_MAX_FRAME_BYTES
+from leaderboard import Leaderboard
+from models import GameState, Player, Question
+from scheduler import TimerHandle, game_scheduler
+from search import question_search
+from static_assets import StaticAssetCache
+from storage import UPLOAD_MAX_BYTES, UploadTooLarge, create_storage, read_upload
+from transfer import (
+    FORMATS as TRANSFER_FORMATS,
+    TRANSFER_CHUNK_SIZE,
+    ImportFailed,
+    TransferError,
+    aexport_questions,
+    aimport_questions,
+    aiter_questions,
+)
+import metrics
 
 # ✨ Configuration Cloudinary
 CLOUDINARY_URL = os.getenv("CLOUDINARY_URL")
@@ -32,8 +61,53 @@ if IS_PRODUCTION:
 else:
     logging.basicConfig(level=logging.INFO)
 
+# Salles de jeu : une salle inactive (sans joueur) est supprimée après ROOM_IDLE_TTL secondes
+DEFAULT_ROOM = "default"
+ROOM_IDLE_TTL = float(os.getenv("ROOM_IDLE_TTL", "300"))
+ROOM_GC_INTERVAL = float(os.getenv("ROOM_GC_INTERVAL", "60"))
+MAX_ROOMS = int(os.getenv("MAX_ROOMS", "10000"))
+ROOM_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Heartbeat : un ping toutes les HEARTBEAT_INTERVAL secondes, et une connexion muette depuis
+# HEARTBEAT_TIMEOUT secondes est considérée morte (0 = désactivé)
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", "15"))
+HEARTBEAT_TIMEOUT = float(os.getenv("HEARTBEAT_TIMEOUT", "45"))
+PING_FRAME = Frame({"type": "ping"})
+
+# Durées des phases de jeu (secondes), mesurées par l'horloge du serveur
+QUESTION_DURATION = float(os.getenv("QUESTION_DURATION", "10"))
+REVEAL_DURATION = float(os.getenv("REVEAL_DURATION", "3"))
+GAME_START_DELAY = float(os.getenv("GAME_START_DELAY", "2"))
+# Sessions : un joueur déconnecté garde sa place (score, nom) pendant SESSION_GRACE secondes,
+# et une reconnexion rejoue jusqu'aux REPLAY_BUFFER derniers messages diffusés dans la salle
+SESSION_GRACE = float(os.getenv("SESSION_GRACE", "30"))
+REPLAY_BUFFER = int(os.getenv("REPLAY_BUFFER", "256"))
+# Attente max (secondes) des images préchargées avant de lancer la question suivante (0 = ne pas attendre)
+IMAGE_WAIT_MAX = float(os.getenv("IMAGE_WAIT_MAX", "2"))
+# Fin de partie anticipée quand la question suivante ne peut pas être chargée
+DECK_ERROR_MESSAGE = "Impossible de charger la question (base de données indisponible). Partie terminée."
+
+# Types de messages WebSocket mesurés individuellement (les autres sont regroupés sous "other")
+HANDLED_MESSAGE_TYPES = {"answer", "set_name", "ready", "image_loaded", "pong"}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    registry.question_count = await db_count_questions()
+    await asyncio.to_thread(static_cache.load)
+    await asyncio.to_thread(question_search.init)
+    await backplane.start(registry.handle_event)
+    gc_task = asyncio.create_task(registry.run_gc())
+    heartbeat_task = asyncio.create_task(registry.run_heartbeat()) if HEARTBEAT_INTERVAL > 0 else None
+    yield
+    gc_task.cancel()
+    if heartbeat_task is not None:
+        heartbeat_task.cancel()
+    await game_scheduler.stop()
+    await backplane.stop()
+
 app = FastAPI(
     title="Party Game",
+    lifespan=lifespan,
     docs_url=None if IS_PRODUCTION else "/docs",
     redoc_url=None if IS_PRODUCTION else "/redoc"
 )
@@ -47,214 +121,578 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Modèle pour les questions
-class Question(BaseModel):
-    image: str
-    question: str
-    answer: str
+# Gestionnaire de connexions d'une salle de jeu.
+# Les joueurs d'une salle peuvent être répartis sur plusieurs workers : `active_connections`
+# ne contient que les sockets locales, `game_state.players` tous les joueurs de la salle.
+# Les broadcasts et mutations d'état sont relayés aux autres workers par le backplane, et
+# seul le worker "leader" de la salle fait avancer la partie (démarrage, questions, timers).
+class ConnectionManager:
+    def __init__(self, room_id: str = DEFAULT_ROOM, total_questions: int = 0, backplane: Optional[Backplane] = None):
+        self.room_id = room_id
+        self.backplane = backplane
+        # Passe à True une fois l'état demandé aux autres workers
+        self.synced = False
+        self.active_connections: Dict[str, ClientConnection] = {}
+        # Paquet de questions de la partie en cours (propre à la salle)
+        self.deck = QuestionDeck([])
+        # Classement trié au fil des changements, partage les objets Player de game_state.players
+        self.leaderboard = Leaderboard()
+        # Classement et statut prêt sont regroupés par tick pendant les rafales de réponses
+        self.scheduler = BroadcastScheduler({
+            "leaderboard": self.flush_leaderboard,
+            "ready_status": self.flush_ready_status
+        })
+        self.last_activity = time.monotonic()
+        # Numérotation des broadcasts de la salle et derniers frames envoyés, pour la reprise de session.
+        # L'époque distingue cette instance de salle (redémarrage, autre worker) : les numéros n'y sont pas comparables.
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.history: Deque[Tuple[int, Frame]] = deque(maxlen=REPLAY_BUFFER)
+        # Expiration programmée des joueurs déconnectés, par id de joueur
+        self.expiring: Dict[str, TimerHandle] = {}
+        self.game_state = GameState(total_questions=total_questions)
+
+    async def connect(self, websocket: WebSocket, player_id: str,
+                      last_seq: Optional[int] = None, epoch: Optional[str] = None):
+        """Connecte le joueur, ou reprend sa session s'il est encore dans la salle.
+        Retourne (connexion, rejoué) : si rejoué, les messages manqués depuis `last_seq`
+        ont été renvoyés et l'état complet n'a pas besoin d'être envoyé."""
+        codec, subprotocol = negotiate_codec(websocket)
+        await websocket.accept(subprotocol=subprotocol)
+        previous = self.active_connections.get(player_id)
+        if previous is not None:
+            # Ancien onglet ou socket à moitié morte : fermée, sa boucle de réception s'arrête
+            previous.supersede()
+        connection = ClientConnection(websocket, player_id, on_evict=self.evict, codec=codec)
+        connection.start()
+
+        player = self.game_state.players.get(player_id)
+        # Rejouer avant d'enregistrer la connexion : aucun nouveau broadcast ne peut s'intercaler
+        replayed = player is not None and epoch == self.epoch and self.replay(connection, last_seq)
+        connection.send(Frame({
+            "type": "session",
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "resumed": replayed,
+            "heartbeat": HEARTBEAT_INTERVAL
+        }))
+        self.active_connections[player_id] = connection
+        self.cancel_expiry(player_id)
+
+        if not self.synced:
+            # Récupérer les joueurs déjà présents sur les autres workers
+            self.synced = True
+            await self.publish("hello")
+        if player is not None:
+            # Reprise de session : score, nom et réponse en cours sont conservés
+            player.connected = True
+            player.worker = self.worker_id
+            self.leaderboard.update(player_id)
+        else:
+            player = Player(name=f"Joueur {len(self.game_state.players) + 1}", worker=self.worker_id)
+            self.game_state.players[player_id] = player
+            self.leaderboard.add(player_id, player)
+        await self.publish_player(player_id)
+        await self.broadcast_leaderboard()
+        await self.broadcast_ready_status()
+        return connection, replayed
+
+    async def send_snapshot(self, player_id: str):
+        """État complet de la salle pour un joueur qui (re)joint sans pouvoir rejouer les messages"""
+        # Envoyer le statut de préparation et le nombre total de questions
+        await self.send_personal_message(self.ready_status_message(), player_id)
+
+        # Envoyer le classement complet : les autres joueurs ne recevront que des deltas
+        leaderboard = self.leaderboard_message()
+        leaderboard["rank"] = self.leaderboard.rank(player_id)
+        await self.send_personal_message(leaderboard, player_id)
+
+        # Si le jeu est en cours, envoyer la question actuelle au nouveau joueur
+        if self.game_state.game_started:
+            current_question = self.get_current_question()
+            if current_question:
+                # Envoyer d'abord le signal de démarrage du jeu
+                await self.send_personal_message({
+                    "type": "game_start",
+                    "total_questions": self.game_state.total_questions
+                }, player_id)
+
+                # Puis la question en cours, avec le temps qu'il reste pour y répondre
+                if self.game_state.phase == "question":
+                    await self.send_personal_message(self.question_message(current_question), player_id)
+
+    def replay(self, connection: ClientConnection, last_seq: Optional[int]) -> bool:
+        """Renvoie les frames diffusés après `last_seq`. False si l'écart est trop grand."""
+        if last_seq is None or last_seq > self.seq:
+            return False
+        oldest = self.history[0][0] if self.history else self.seq + 1
+        if last_seq < oldest - 1:
+            return False
+        missed_question = False
+        for seq, frame in self.history:
+            if seq <= last_seq:
+                continue
+            if frame.type == "question":
+                # Le temps restant qu'il contient est périmé : renvoyé à jour ci-dessous
+                missed_question = True
+                continue
+            connection.send(frame)
+        current_question = self.get_current_question()
+        if missed_question and self.game_state.phase == "question" and current_question:
+            connection.send(Frame(self.question_message(current_question)))
+        return True
+
+    def connected_player_ids(self) -> Set[str]:
+        return {pid for pid, p in self.game_state.players.items() if p.connected}
+
+    def has_remote_players(self) -> bool:
+        """Joueurs connectés à un autre worker : la réplique locale de la salle doit rester"""
+        return any(p.connected and p.worker != self.worker_id for p in self.game_state.players.values())
+
+    def cancel_expiry(self, player_id: str):
+        handle = self.expiring.pop(player_id, None)
+        if handle is not None:
+            handle.cancel()
+
+    async def expire_session(self, player_id: str):
+        """Fin du délai de grâce : le joueur déconnecté quitte vraiment la salle"""
+        self.expiring.pop(player_id, None)
+        player = self.game_state.players.get(player_id)
+        if player is None or player.connected:
+            return
+        await self.publish("player_left", player_id=player_id)
+        await self.remove_player(player_id)
 
-# ✨ NOUVEAU : Charger les questions depuis PostgreSQL/Neon (ou JSON en local)
-QUESTIONS = db_load_questions()
+    async def evict(self, connection: ClientConnection):
+        """Appelé quand un client trop lent a été éjecté par la file sortante"""
+        await self.disconnect(connection.player_id, connection)
 
-# Gestionnaire de connexions
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-        self.game_state = {
-            "players": {},
-            "current_question": None,
-            "leaderboard": [],
-            "current_question_index": 0,
-            "question_start_time": None,
-            "timer_task": None,
-            "answered_players": set(),
-            "ready_players": set(),
-            "game_started": False,
-            "total_questions": len(QUESTIONS),
-            "used_question_ids": set()  # IDs des questions déjà posées
-        }
+    async def disconnect(self, player_id: str, connection: ClientConnection | None = None):
+        current = self.active_connections.get(player_id)
+        if current is None:
+            return
+        # Une ancienne socket qui se ferme ne doit pas éjecter une reconnexion plus récente
+        if connection is not None and current is not connection:
+            return
+        current.close()
+        del self.active_connections[player_id]
 
-    async def connect(self, websocket: WebSocket, player_id: str):
-        await websocket.accept()
-        self.active_connections[player_id] = websocket
-        self.game_state["players"][player_id] = {
-            "name": f"Joueur {len(self.active_connections)}",
-            "score": 0,
-            "last_answer": "",
-            "answered": False
-        }
-        await self.broadcast_leaderboard()
+        player = self.game_state.players.get(player_id)
+        if SESSION_GRACE <= 0 or player is None:
+            await self.publish("player_left", player_id=player_id)
+            await self.remove_player(player_id)
+            return
+
+        # Garder la place du joueur le temps qu'il se reconnecte
+        player.connected = False
+        self.cancel_expiry(player_id)
+        self.expiring[player_id] = game_scheduler.call_later(SESSION_GRACE, lambda: self.expire_session(player_id))
+        await self.publish_player(player_id)
+        await self.broadcast_ready_status()
+        # Les joueurs restants sont peut-être tous prêts
+        await self.check_all_ready()
 
-    async def disconnect(self, player_id: str):
-        if player_id in self.active_connections:
-            del self.active_connections[player_id]
-        if player_id in self.game_state["players"]:
-            del self.game_state["players"][player_id]
+    async def remove_player(self, player_id: str):
+        if player_id in self.game_state.players:
+            del self.game_state.players[player_id]
+        self.leaderboard.remove(player_id)
 
         # Retirer le joueur de la liste des prêts
-        if player_id in self.game_state["ready_players"]:
-            self.game_state["ready_players"].discard(player_id)
+        if player_id in self.game_state.ready_players:
+            self.game_state.ready_players.discard(player_id)
 
         # Broadcast le nouveau statut si des joueurs sont encore connectés
         if len(self.active_connections) > 0:
-            await self.broadcast_ready_status()
-            await self.broadcast_leaderboard()
+            await self.broadcast_ready_status(forward=False)
+            await self.broadcast_leaderboard(forward=False)
 
         # Si tous les joueurs se déconnectent, reset le jeu
-        if len(self.active_connections) == 0:
+        if len(self.game_state.players) == 0:
             if not IS_PRODUCTION:
                 print("🔄 Tous les joueurs déconnectés - Reset du jeu")
             else:
                 logging.info("All players disconnected - Game reset")
-            self.reset_game()
-
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
-
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections.values():
-            await connection.send_text(json.dumps(message))
-
-    async def broadcast_leaderboard(self):
-        # Créer le leaderboard trié par score
-        leaderboard = [
-            {
-                "name": player["name"],
-                "score": player["score"],
-                "last_answer": player.get("last_answer", ""),
-                "answered": player.get("answered", False)
-            }
-            for player in self.game_state["players"].values()
-        ]
-        leaderboard.sort(key=lambda x: x["score"], reverse=True)
+            await self.reset_game()
+
+    async def send_personal_message(self, message: dict, player_id: str):
+        connection = self.active_connections.get(player_id)
+        if connection is not None:
+            connection.send(Frame(message))
+
+    async def broadcast(self, message: dict, forward: bool = True):
+        """Dépose le message dans la file de chaque client sans attendre les envois.
+        Le frame est encodé une seule fois par codec et partagé entre tous les clients.
+        Avec `forward`, le message est aussi relayé aux joueurs des autres workers."""
+        started = time.perf_counter()
+        self.seq += 1
+        frame = Frame({**message, "seq": self.seq})
+        self.history.append((self.seq, frame))
+        key = frame.type if frame.type in COALESCED_TYPES else None
+        for connection in list(self.active_connections.values()):
+            connection.send(frame, key)
+        if self.active_connections:
+            metrics.broadcast_seconds.observe(time.perf_counter() - started)
+            # Encodage mis en cache dans le frame : les writers le réutilisent
+            metrics.broadcast_frame_bytes.labels(frame.type).observe(len(frame.encode(DEFAULT_CODEC)))
+        if forward:
+            await self.publish("broadcast", message=message)
+
+    @property
+    def worker_id(self) -> Optional[str]:
+        return self.backplane.worker_id if self.backplane else None
+
+    def is_leader(self) -> bool:
+        """Le leader est le plus petit worker ayant des joueurs dans la salle"""
+        workers = [p.worker or "" for p in self.game_state.players.values()]
+        return not workers or min(workers) == (self.worker_id or "")
+
+    async def publish(self, kind: str, **data):
+        """Relaye un événement de la salle aux autres workers"""
+        if self.backplane is not None:
+            await self.backplane.publish({"room": self.room_id, "kind": kind, **data})
+
+    async def publish_player(self, player_id: str):
+        player = self.game_state.players.get(player_id)
+        if player is not None:
+            await self.publish("player", player_id=player_id, player=player.to_dict())
+
+    async def publish_game(self):
+        await self.publish(
+            "game",
+            game_started=self.game_state.game_started,
+            current_question_index=self.game_state.current_question_index,
+            total_questions=self.game_state.total_questions,
+            question_ids=self.deck.ids
+        )
+
+    def game_snapshot(self) -> dict:
+        return {
+            "players": {player_id: player.to_dict() for player_id, player in self.game_state.players.items()},
+            "ready_players": list(self.game_state.ready_players),
+            "game_started": self.game_state.game_started,
+            "current_question_index": self.game_state.current_question_index,
+            "total_questions": self.game_state.total_questions,
+            "question_ids": self.deck.ids
+        }
 
-        await self.broadcast({
-            "type": "leaderboard_update",
-            "leaderboard": leaderboard
-        })
+    async def apply_game(self, data: dict):
+        """Applique l'avancement de la partie décidé par le leader"""
+        question_ids = data.get("question_ids") or []
+        if question_ids != self.deck.ids:
+            self.deck = QuestionDeck(question_ids)
 
-    async def broadcast_ready_status(self):
-        """Envoyer le statut prêt avec la liste détaillée des joueurs"""
-        players_status = []
-        for player_id, player_data in self.game_state["players"].items():
-            players_status.append({
-                "id": player_id,
-                "name": player_data["name"],
-                "ready": player_id in self.game_state["ready_players"]
-            })
+        if data["current_question_index"] != self.game_state.current_question_index:
+            self.game_state.answered_players.clear()
+            for player in self.game_state.players.values():
+                player.clear_answer()
 
-        await self.broadcast({
+        self.game_state.game_started = data["game_started"]
+        self.game_state.current_question_index = data["current_question_index"]
+        self.game_state.total_questions = data["total_questions"]
+
+        current_question = await self.deck.load(data["current_question_index"])
+        if current_question:
+            self.game_state.used_question_ids.add(current_question.id)
+
+    async def apply_event(self, event: dict):
+        """Applique un événement reçu d'un autre worker (sans le republier)"""
+        kind = event["kind"]
+        if kind == "broadcast":
+            await self.broadcast(event["message"], forward=False)
+        elif kind == "player":
+            # Le worker d'origine a déjà diffusé le changement de classement
+            player = Player.from_dict(event["player"])
+            self.game_state.players[event["player_id"]] = player
+            self.leaderboard.add(event["player_id"], player, track=False)
+            if player.connected:
+                # Reconnecté sur un autre worker : ne plus l'expirer ici
+                self.cancel_expiry(event["player_id"])
+            await self.check_images_loaded()
+        elif kind == "player_left":
+            self.cancel_expiry(event["player_id"])
+            await self.remove_player(event["player_id"])
+        elif kind == "ready":
+            self.game_state.ready_players.add(event["player_id"])
+            await self.check_all_ready()
+        elif kind == "ready_clear":
+            self.game_state.ready_players.clear()
+        elif kind == "game":
+            await self.apply_game(event)
+        elif kind == "phase":
+            self.set_phase(event["phase"])
+        elif kind == "reset":
+            await self.reset_game()
+        elif kind == "hello":
+            if self.active_connections:
+                await self.publish("snapshot", **self.game_snapshot())
+        elif kind == "snapshot":
+            for player_id, data in event["players"].items():
+                if player_id not in self.game_state.players:
+                    player = Player.from_dict(data)
+                    self.game_state.players[player_id] = player
+                    self.leaderboard.add(player_id, player, track=False)
+            self.game_state.ready_players.update(event["ready_players"])
+            if event["game_started"] and not self.game_state.game_started:
+                await self.apply_game(event)
+
+    def leaderboard_message(self) -> dict:
+        """Classement complet (arrivée d'un joueur ou resynchronisation)"""
+        return self.leaderboard.snapshot_message()
+
+    async def broadcast_leaderboard(self, forward: bool = True):
+        """Programme l'envoi des changements du classement au prochain tick"""
+        await self.scheduler.request("leaderboard", forward)
+
+    async def flush_leaderboard(self, forward: bool = True):
+        """Diffuse uniquement les entrées du classement modifiées depuis le dernier envoi"""
+        delta = self.leaderboard.take_delta()
+        if delta is not None:
+            await self.broadcast(delta, forward)
+
+    def ready_status_message(self) -> dict:
+        """Statut prêt avec la liste détaillée des joueurs, en un seul parcours"""
+        ready_players = self.game_state.ready_players
+        players_status = []
+        ready_count = connected_count = 0
+        for player_id, player in self.game_state.players.items():
+            ready = player_id in ready_players
+            players_status.append(player.status_entry(player_id, ready))
+            # Les joueurs en cours de reconnexion ne sont pas attendus
+            if player.connected:
+                connected_count += 1
+                ready_count += ready
+        return {
             "type": "ready_status",
-            "ready_count": len(self.game_state["ready_players"]),
-            "total_count": len(self.active_connections),
-            "players": players_status
-        })
+            "ready_count": ready_count,
+            "total_count": connected_count,
+            "players": players_status,
+            "total_questions": self.game_state.total_questions
+        }
+
+    async def broadcast_ready_status(self, forward: bool = True):
+        """Programme l'envoi du statut prêt au prochain tick"""
+        await self.scheduler.request("ready_status", forward)
+
+    async def flush_ready_status(self, forward: bool = True):
+        await self.broadcast(self.ready_status_message(), forward)
+
+    def question_message(self, question: Question) -> dict:
+        return {
+            "type": "question",
+            "data": question.payload,
+            "question_number": self.game_state.current_question_index + 1,
+            "total_questions": self.game_state.total_questions,
+            "duration": QUESTION_DURATION,
+            "time_left": self.time_left(),
+            # Horodatage serveur (epoch) de l'envoi, utilisé par benchmark.py pour mesurer la diffusion
+            "sent_at": time.time()
+        }
+
+    def prefetch_message(self, index: int, question: Question) -> dict:
+        """Image de la question à venir, sans la question ni la réponse"""
+        return {
+            "type": "prefetch",
+            "question_number": index + 1,
+            "image": question.image
+        }
+
+    async def prefetch_question(self, index: int):
+        """Envoie l'image de la question `index` pour que les clients la chargent à l'avance"""
+        try:
+            question = await self.deck.load(index)
+        except Exception:
+            # Optionnel : la question sera rechargée au moment de la poser
+            logging.exception(f"Salle {self.room_id}: préchargement de la question {index + 1} impossible")
+            return
+        if question and question.image:
+            self.game_state.prefetch_number = index + 1
+            await self.broadcast(self.prefetch_message(index, question))
+
+    async def image_loaded(self, player_id: str, question_number: int, load_ms: float, source: str):
+        """Accusé de chargement d'une image par un client"""
+        metrics.image_load_seconds.labels(source).observe(max(0.0, load_ms) / 1000)
+        player = self.game_state.players.get(player_id)
+        if source != "prefetch" or player is None or player.image_loaded == question_number:
+            return
+        player.image_loaded = question_number
+        await self.publish_player(player_id)
+        await self.check_images_loaded()
+
+    def images_pending(self) -> int:
+        """Nombre de joueurs n'ayant pas encore chargé l'image de la question suivante"""
+        number = self.game_state.prefetch_number
+        if number != self.game_state.current_question_index + 2:
+            return 0
+        return sum(1 for p in self.game_state.players.values()
+                   if p.connected and p.image_loaded != number)
+
+    async def check_images_loaded(self):
+        """En phase de préparation, lance la question dès que toutes les images sont chargées"""
+        if self.game_state.phase == "preparing" and self.is_leader() and self.images_pending() == 0:
+            self.cancel_timer()
+            await self.next_question()
+
+    def time_left(self) -> int:
+        """Secondes restantes affichées pour la question en cours (arrondi supérieur, comme le compte à rebours client)"""
+        start = self.game_state.question_start_time
+        if self.game_state.phase != "question" or start is None:
+            return math.ceil(QUESTION_DURATION)
+        return max(0, math.ceil(QUESTION_DURATION - (game_scheduler.now() - start)))
+
+    def set_phase(self, phase: str):
+        self.game_state.phase = phase
+        if phase == "question":
+            self.game_state.question_start_time = game_scheduler.now()
+
+    def schedule(self, delay: float, callback) -> TimerHandle:
+        """Programme la prochaine transition de phase (annule la précédente)"""
+        self.cancel_timer()
+        handle = game_scheduler.call_later(delay, callback)
+        self.game_state.timer_task = handle
+        return handle
+
+    def cancel_timer(self):
+        handle = self.game_state.timer_task
+        if handle is not None:
+            handle.cancel()
+            self.game_state.timer_task = None
 
     async def player_ready(self, player_id: str):
         """Marquer un joueur comme prêt"""
-        self.game_state["ready_players"].add(player_id)
+        self.game_state.ready_players.add(player_id)
+        await self.publish("ready", player_id=player_id)
 
         # Envoyer le statut "prêt" à tous avec la liste des joueurs
         await self.broadcast_ready_status()
 
-        # Si tous les joueurs sont prêts, démarrer le jeu
-        if len(self.game_state["ready_players"]) == len(self.active_connections) and len(self.active_connections) > 0:
-            if not self.game_state["game_started"]:
+        await self.check_all_ready()
+
+    async def check_all_ready(self):
+        """Si tous les joueurs sont prêts, le leader démarre le jeu ou la question suivante"""
+        connected = self.connected_player_ids()
+        if connected and connected <= self.game_state.ready_players and self.is_leader():
+            if not self.game_state.game_started:
                 await self.start_game()
-            else:
-                # Si le jeu a déjà commencé, passer à la question suivante
-                await self.next_question()
+            elif self.game_state.phase == "waiting":
+                # Si le jeu a déjà commencé, passer à la question suivante, en laissant
+                # aux retardataires jusqu'à IMAGE_WAIT_MAX secondes pour finir de charger l'image
+                if IMAGE_WAIT_MAX > 0 and self.images_pending():
+                    self.set_phase("preparing")
+                    await self.publish("phase", phase="preparing")
+                    self.schedule(IMAGE_WAIT_MAX, self.next_question)
+                else:
+                    await self.next_question()
 
     async def start_game(self):
         """Démarrer le jeu"""
-        if self.game_state["game_started"]:
+        # La phase "starting" est posée avant le tirage : un second appel pendant
+        # l'accès à la base (ready répété, départ d'un joueur) ne relance pas la partie
+        if self.game_state.game_started or self.game_state.phase == "starting":
             return
+        self.set_phase("starting")
 
-        # Recharger les questions depuis la base de données
-        all_questions = db_load_questions()
-
-        # Filtrer pour exclure les questions déjà utilisées
-        available_questions = [
-            q for q in all_questions
-            if q["id"] not in self.game_state["used_question_ids"]
-        ]
+        # Tirer au hasard (côté base) les questions pas encore posées
+        try:
+            deck = await QuestionDeck.draw(self.game_state.used_question_ids)
+        except Exception:
+            self.set_phase("lobby")
+            raise
+        if self.game_state.phase != "starting":
+            # Partie réinitialisée pendant le tirage
+            return
 
         # Si toutes les questions ont été utilisées, afficher un message
-        if len(available_questions) == 0:
+        if len(deck) == 0:
+            self.set_phase("lobby")
             await self.broadcast({
                 "type": "error",
                 "message": "Toutes les questions ont déjà été posées ! Ajoutez de nouvelles questions ou redémarrez le serveur."
             })
             # Réinitialiser les joueurs prêts
-            self.game_state["ready_players"].clear()
+            self.game_state.ready_players.clear()
+            await self.publish("ready_clear")
             await self.broadcast({
                 "type": "ready_status",
                 "ready_count": 0,
-                "total_count": len(self.active_connections)
+                "total_count": len(self.game_state.players)
             })
             return
 
-        # Assigner les questions disponibles
-        global QUESTIONS
-        QUESTIONS = available_questions
-
-        # Mélanger l'ordre des questions pour cette partie
-        try:
-            random.shuffle(QUESTIONS)
-        except Exception:
-            # si shuffle échoue, on laisse l'ordre tel quel
-            logging.exception("Impossible de shuffle QUESTIONS")
-        self.game_state["total_questions"] = len(QUESTIONS)
-        self.game_state["current_question_index"] = 0
+        # Assigner le paquet de la partie (déjà mélangé par la base)
+        self.deck = deck
+        self.game_state.total_questions = len(self.deck)
+        self.game_state.current_question_index = 0
 
-        self.game_state["game_started"] = True
+        self.game_state.game_started = True
+        await self.publish_game()
 
         # Envoyer le signal de démarrage
         await self.broadcast({
             "type": "game_start",
-            "total_questions": self.game_state["total_questions"]
+            "total_questions": self.game_state.total_questions
         })
 
-        # Attendre 2 secondes puis démarrer la première question
-        await asyncio.sleep(2)
+        # Précharger l'image de la première question puis la lancer après GAME_START_DELAY secondes
+        await self.prefetch_question(0)
+        self.schedule(GAME_START_DELAY, self.first_question)
 
-        current_question = self.get_current_question()
+    async def first_question(self):
+        try:
+            current_question = await self.load_current_question()
+        except Exception:
+            logging.exception(f"Salle {self.room_id}: première question impossible à charger")
+            await self.end_game(DECK_ERROR_MESSAGE, announce_winner=False)
+            return
         if current_question:
             # Marquer cette question comme utilisée
-            if "id" in current_question:
-                self.game_state["used_question_ids"].add(current_question["id"])
+            self.game_state.used_question_ids.add(current_question.id)
 
-            await self.broadcast({
-                "type": "question",
-                "data": current_question,
-                "question_number": self.game_state["current_question_index"] + 1,
-                "total_questions": self.game_state["total_questions"]
-            })
-            asyncio.create_task(self.start_question_timer())
+            await self.start_question_timer()
+            await self.broadcast(self.question_message(current_question))
+        else:
+            # Toutes les questions du paquet ont été supprimées entre-temps
+            await self.end_game()
 
     def get_current_question(self):
-        idx = self.game_state["current_question_index"]
-        if idx < len(QUESTIONS):
-            return QUESTIONS[idx]
-        return None
+        return self.deck.peek(self.game_state.current_question_index)
+
+    async def load_current_question(self):
+        """Charge la question courante depuis le paquet (les questions supprimées sont sautées)"""
+        question = await self.deck.load(self.game_state.current_question_index)
+        self.game_state.total_questions = len(self.deck)
+        return question
 
     async def start_question_timer(self):
-        """Lance un timer de 10 secondes pour la question"""
-        await asyncio.sleep(10)
+        """Démarre la phase question : la réponse sera révélée après QUESTION_DURATION secondes"""
+        self.set_phase("question")
+        await self.publish("phase", phase="question")
+        self.schedule(QUESTION_DURATION, self.reveal_answer)
+
+    async def reveal_answer(self):
+        """Fin du temps : révéler la réponse, puis attendre REVEAL_DURATION secondes"""
+        self.set_phase("reveal")
+        await self.publish("phase", phase="reveal")
 
-        # Révéler la réponse
         current_question = self.get_current_question()
         if current_question:
             await self.broadcast({
                 "type": "reveal_answer",
-                "answer": current_question["answer"]
+                "answer": current_question.matcher.display
             })
 
-        # Attendre 3 secondes pour voir la réponse
-        await asyncio.sleep(3)
+        # Les clients chargent l'image suivante pendant la révélation et l'attente
+        self.schedule(REVEAL_DURATION, self.wait_next_question)
+        await self.prefetch_question(self.game_state.current_question_index + 1)
+
+    async def wait_next_question(self):
+        """Phase d'attente : chacun doit se déclarer prêt pour la question suivante"""
+        self.game_state.timer_task = None
+        self.set_phase("waiting")
+        await self.publish("phase", phase="waiting")
 
         # Reset les joueurs prêts pour la synchronisation
-        self.game_state["ready_players"].clear()
+        self.game_state.ready_players.clear()
+        await self.publish("ready_clear")
 
         # Demander aux joueurs de se préparer pour la question suivante
         await self.broadcast({
@@ -267,157 +705,277 @@ class ConnectionManager:
 
     async def next_question(self):
         """Passe à la question suivante"""
-        self.game_state["current_question_index"] += 1
-        self.game_state["answered_players"].clear()
+        # Phase de transition posée avant tout await : un ready ou un image_loaded tardif
+        # (ou le timer de préparation) ne peut plus faire avancer la partie une seconde fois
+        if self.game_state.phase not in ("waiting", "preparing"):
+            return
+        self.cancel_timer()
+        self.set_phase("advancing")
+
+        self.game_state.current_question_index += 1
+        self.game_state.answered_players.clear()
 
         # Réinitialiser les réponses pour la nouvelle question
-        for player_id in self.game_state["players"]:
-            self.game_state["players"][player_id]["last_answer"] = ""
-            self.game_state["players"][player_id]["answered"] = False
+        for player in self.game_state.players.values():
+            player.clear_answer()
+        self.leaderboard.clear_answers()
 
-        current_question = self.get_current_question()
+        try:
+            current_question = await self.load_current_question()
+        except Exception:
+            logging.exception(f"Salle {self.room_id}: question suivante impossible à charger")
+            await self.end_game(DECK_ERROR_MESSAGE, announce_winner=False)
+            return
+        await self.publish_game()
 
         if current_question:
             # Marquer cette question comme utilisée
-            if "id" in current_question:
-                self.game_state["used_question_ids"].add(current_question["id"])
+            self.game_state.used_question_ids.add(current_question.id)
 
-            # Envoyer la nouvelle question
-            await self.broadcast({
-                "type": "question",
-                "data": current_question,
-                "question_number": self.game_state["current_question_index"] + 1,
-                "total_questions": self.game_state["total_questions"]
-            })
-
-            # Démarrer le timer
-            asyncio.create_task(self.start_question_timer())
+            # Démarrer le timer puis envoyer la nouvelle question
+            await self.start_question_timer()
+            await self.broadcast(self.question_message(current_question))
         else:
-            # Fin du jeu - trouver le gagnant
-            leaderboard = [
-                {"name": player["name"], "score": player["score"]}
-                for player in self.game_state["players"].values()
-            ]
-            leaderboard.sort(key=lambda x: x["score"], reverse=True)
+            await self.end_game()
 
-            winner = leaderboard[0] if leaderboard else None
+    async def end_game(self, message: str = "Fin du jeu ! 🎉", announce_winner: bool = True):
+        """Fin de partie : paquet épuisé, ou question impossible à charger"""
+        self.cancel_timer()
+        self.set_phase("lobby")
+        await self.publish("phase", phase="lobby")
+        # Fin du jeu - trouver le gagnant
+        top = self.leaderboard.top(1) if announce_winner else []
+        winner = {"name": top[0]["name"], "score": top[0]["score"]} if top else None
 
-            await self.broadcast({
-                "type": "game_over",
-                "message": "Fin du jeu ! 🎉",
-                "winner": winner
-            })
+        await self.broadcast({
+            "type": "game_over",
+            "message": message,
+            "winner": winner
+        })
 
-    def reset_game(self):
+    async def reset_game(self):
         """Reset complet du jeu"""
-        self.game_state["current_question_index"] = 0
-        self.game_state["question_start_time"] = None
-        self.game_state["answered_players"].clear()
-        self.game_state["ready_players"].clear()
-        self.game_state["game_started"] = False
+        self.cancel_timer()
+        # Les mises à jour groupées en attente décrivent l'ancienne partie
+        self.scheduler.cancel()
+        self.set_phase("lobby")
+        self.game_state.current_question_index = 0
+        self.game_state.question_start_time = None
+        self.game_state.answered_players.clear()
+        self.game_state.ready_players.clear()
+        self.game_state.game_started = False
+        self.game_state.prefetch_number = None
 
         # Reset les scores et réponses des joueurs
-        for player_id in self.game_state["players"]:
-            self.game_state["players"][player_id]["score"] = 0
-            self.game_state["players"][player_id]["last_answer"] = ""
-            self.game_state["players"][player_id]["answered"] = False
+        for player in self.game_state.players.values():
+            player.score = 0
+            player.clear_answer()
+        self.leaderboard.rebuild()
 
         # NE PAS réinitialiser used_question_ids pour garder l'historique des questions
         # Les questions utilisées restent marquées même après reset
 
         # Recharger les questions (elles seront filtrées dans start_game)
-        global QUESTIONS
-        all_questions = db_load_questions()
-        self.game_state["total_questions"] = len(all_questions)
+        self.game_state.total_questions = await db_count_questions()
 
-    async def check_answer(self, player_id: str, answer: str, time_left: int):
+    async def check_answer(self, player_id: str, answer: str):
         # Vérifier si le joueur a déjà trouvé la bonne réponse
-        if player_id in self.game_state["answered_players"]:
+        if player_id in self.game_state.answered_players:
             return {"correct": False, "message": "Tu as déjà répondu correctement ! ✓"}
 
         current_question = self.get_current_question()
         if not current_question:
             return {"correct": False, "message": "Pas de question en cours"}
 
+        if self.game_state.phase != "question":
+            return {"correct": False, "message": "Temps écoulé ! ⏱️"}
+
         # Vérifier la réponse
-        if answer.lower().strip() == current_question["answer"].lower().strip():
+        player = self.game_state.players[player_id]
+        if current_question.matcher.matches(answer):
             # Marquer le joueur comme ayant trouvé la bonne réponse
-            self.game_state["answered_players"].add(player_id)
-            self.game_state["players"][player_id]["answered"] = True
-            self.game_state["players"][player_id]["last_answer"] = "Réponse trouvée ✓"
-
-            # Calculer les points selon le temps restant
-            if time_left >= 7:
+            self.game_state.answered_players.add(player_id)
+            player.answered = True
+            player.last_answer = "Réponse trouvée ✓"
+
+            # Calculer les points selon le temps restant mesuré par le serveur
+            # (seuils de 7, 4 et 1 secondes pour une question de 10 secondes)
+            time_left = self.time_left()
+            if time_left >= 0.7 * QUESTION_DURATION:
                 points = 10
-            elif time_left >= 4:
+            elif time_left >= 0.4 * QUESTION_DURATION:
                 points = 7
-            elif time_left >= 1:
+            elif time_left >= 0.1 * QUESTION_DURATION:
                 points = 4
             else:
                 points = 2
 
-            self.game_state["players"][player_id]["score"] += points
+            player.score += points
+            self.leaderboard.update(player_id)
+            await self.publish_player(player_id)
             await self.broadcast_leaderboard()
 
             # Vérifier si le joueur a gagné (300 points)
-            if self.game_state["players"][player_id]["score"] >= 300:
+            if player.score >= 300:
                 await self.broadcast({
                     "type": "winner",
-                    "player_name": self.game_state["players"][player_id]["name"],
-                    "score": self.game_state["players"][player_id]["score"]
+                    "player_name": player.name,
+                    "score": player.score
                 })
 
-            return {"correct": True, "message": f"Bonne réponse ! +{points} pts 🎉", "points": points}
+            return {"correct": True, "message": f"Bonne réponse ! +{points} pts 🎉", "points": points,
+                    "rank": self.leaderboard.rank(player_id)}
 
         # Mauvaise réponse - sauvegarder et le joueur peut réessayer
-        self.game_state["players"][player_id]["last_answer"] = answer
-        self.game_state["players"][player_id]["answered"] = False
+        player.last_answer = answer
+        player.answered = False
+        self.leaderboard.update(player_id)
+        await self.publish_player(player_id)
         await self.broadcast_leaderboard()
         return {"correct": False, "message": "Mauvaise réponse... Réessaie ! ❌", "can_retry": True}
 
-manager = ConnectionManager()
-
-# Créer le dossier assets s'il n'existe pas
-ASSETS_DIR = Path("static/assets")
-ASSETS_DIR.mkdir(parents=True, exist_ok=True)
+class RoomRegistry:
+    """Salles de jeu indépendantes, créées à la demande et retrouvées par leur id"""
+
+    def __init__(self, backplane: Optional[Backplane] = None):
+        self.rooms: Dict[str, ConnectionManager] = {}
+        self.backplane = backplane
+        self.question_count = 0
+
+    def get(self, room_id: str) -> Optional[ConnectionManager]:
+        return self.rooms.get(room_id)
+
+    def get_or_create(self, room_id: str) -> Optional[ConnectionManager]:
+        """Retourne la salle, en la créant si besoin. None si la limite de salles est atteinte."""
+        room = self.rooms.get(room_id)
+        if room is None:
+            if len(self.rooms) >= MAX_ROOMS:
+                return None
+            room = ConnectionManager(room_id, self.question_count, self.backplane)
+            self.rooms[room_id] = room
+        room.last_activity = time.monotonic()
+        return room
+
+    def set_question_count(self, count: int):
+        """Met à jour le nombre de questions affiché dans les salles qui n'ont pas démarré"""
+        self.question_count = count
+        for room in self.rooms.values():
+            if not room.game_state.game_started:
+                room.game_state.total_questions = count
+
+    def collect_idle(self) -> int:
+        """Supprime les salles sans joueur (sur aucun worker) depuis plus de ROOM_IDLE_TTL secondes"""
+        now = time.monotonic()
+        idle = [
+            room_id for room_id, room in self.rooms.items()
+            if not room.active_connections and not room.expiring and not room.has_remote_players()
+            and now - room.last_activity > ROOM_IDLE_TTL
+        ]
+        for room_id in idle:
+            self.rooms.pop(room_id).scheduler.cancel()
+        return len(idle)
+
+    async def handle_event(self, event: dict):
+        """Point d'entrée des événements reçus des autres workers"""
+        room_id = event.get("room")
+        if not room_id:
+            return
+        if event["kind"] == "broadcast":
+            # Pas de salle locale = aucun joueur local à prévenir
+            room = self.get(room_id)
+        else:
+            room = self.get_or_create(room_id)
+        if room is not None:
+            await room.apply_event(event)
 
-# API pour uploader une image vers Cloudinary
+    async def run_gc(self):
+        while True:
+            await asyncio.sleep(ROOM_GC_INTERVAL)
+            removed = self.collect_idle()
+            if removed:
+                logging.info(f"{removed} salle(s) inactive(s) supprimée(s)")
+
+    def reap_and_ping(self) -> int:
+        """Ferme les connexions muettes depuis HEARTBEAT_TIMEOUT et envoie un ping aux autres"""
+        now = time.monotonic()
+        reaped = 0
+        for room in list(self.rooms.values()):
+            for connection in list(room.active_connections.values()):
+                if connection.closed:
+                    continue  # déjà en cours de fermeture
+                if now - connection.last_seen > HEARTBEAT_TIMEOUT:
+                    # Même chemin qu'un client trop lent : fermeture puis disconnect()
+                    connection.evict("pas de réponse au heartbeat", code=1001)
+                    reaped += 1
+                else:
+                    connection.send(PING_FRAME)
+        if reaped:
+            metrics.reaped_connections_total.inc(reaped)
+        return reaped
+
+    async def run_heartbeat(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            reaped = self.reap_and_ping()
+            if reaped:
+                logging.info(f"{reaped} connexion(s) morte(s) fermée(s)")
+
+backplane = create_backplane()
+registry = RoomRegistry(backplane)
+
+# Jauges calculées au moment du scrape de /metrics, sans coût sur le chemin chaud
+metrics.rooms.set_function(lambda: len(registry.rooms))
+metrics.players.set_function(lambda: sum(len(r.game_state.players) for r in registry.rooms.values()))
+metrics.ready_players.set_function(lambda: sum(len(r.game_state.ready_players) for r in registry.rooms.values()))
+metrics.connections.set_function(lambda: sum(len(r.active_connections) for r in registry.rooms.values()))
+metrics.outbound_queue_max.set_function(lambda: max(
+    (c.pending for r in registry.rooms.values() for c in r.active_connections.values()), default=0))
+metrics.active_timers.set_function(lambda: game_scheduler.active_timers)
+
+# Stockage des images uploadées (Cloudinary, disque local ou mémoire)
+image_storage = create_storage()
+
+# Marge pour l'enveloppe multipart (en-têtes, boundary) autour du fichier
+UPLOAD_FORM_OVERHEAD = 16 * 1024
+
+# API pour uploader une image (Cloudinary ou stockage local)
 @app.post("/api/upload-image")
-async def upload_image(file: UploadFile = File(...)):
+async def upload_image(request: Request):
+    started = time.perf_counter()
     try:
-        if not file.content_type in ["image/png", "image/jpeg", "image/jpg", "image/gif"]:
-            raise HTTPException(status_code=400, detail="Seuls les fichiers PNG, JPG et GIF sont acceptés")
-
-        # Upload vers Cloudinary
-        if CLOUDINARY_URL:
-            result = cloudinary.uploader.upload(
-                file.file,
-                folder="party-game-questions",
-                resource_type="image"
-            )
-            image_url = result["secure_url"]
-
-            return JSONResponse(content={
-                "message": "Image uploadée avec succès sur Cloudinary",
-                "url": image_url
-            })
-        else:
-            # Fallback local si pas de Cloudinary (dev)
-            import time
-            file_extension = file.filename.split('.')[-1]
-            unique_filename = f"question_{int(time.time())}_{os.urandom(4).hex()}.{file_extension}"
-            file_path = ASSETS_DIR / unique_filename
-
-            with file_path.open("wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-
-            return JSONResponse(content={
-                "message": "Image uploadée localement",
-                "url": f"/static/assets/{unique_filename}"
-            })
+        # Refuser d'emblée un corps annoncé trop gros, sans le lire
+        content_length = request.headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD:
+            raise UploadTooLarge(f"Image trop volumineuse (max {UPLOAD_MAX_BYTES // 1024} Ko)")
+
+        async with request.form(max_files=1) as form:
+            file = form.get("file")
+            if file is None or isinstance(file, str):
+                raise HTTPException(status_code=400, detail="Aucun fichier reçu")
+            if not file.content_type in ["image/png", "image/jpeg", "image/jpg", "image/gif"]:
+                raise HTTPException(status_code=400, detail="Seuls les fichiers PNG, JPG et GIF sont acceptés")
+
+            # Lecture par morceaux avec taille max, puis envoi depuis le pool de threads d'upload
+            data = await read_upload(file)
+            stored = await image_storage.save(data, file.filename or "image", file.content_type)
+
+        # `url` désigne la variante WebP réduite quand elle existe : c'est elle qui ira dans la question
+        return JSONResponse(content={
+            "message": image_storage.message,
+            "url": stored["url"],
+            "original": stored["original"],
+            "variants": stored["variants"],
+            "deduplicated": stored["deduplicated"]
+        })
 
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de l'upload: {str(e)}")
+    finally:
+        metrics.upload_seconds.observe(time.perf_counter() - started)
 
 # ✨ NOUVEAU : API pour ajouter une question (avec PostgreSQL/Neon)
 @app.post("/api/questions")
@@ -493,15 +1051,20 @@ async def add_question(request: Request, payload: dict | None = Body(None)):
         question_text = question_text.strip()
         answer = answer.strip()
 
+        # Questions très proches déjà en base : signalées, sans bloquer l'ajout
+        possible_duplicates = await question_search.aduplicates(question_text)
+
         # Sauvegarder en base
-        new_question = db_save_question(image=image, question_text=question_text, answer=answer)
+        new_question = await db_save_question(image=image, question_text=question_text, answer=answer)
 
         if new_question:
-            global QUESTIONS
-            QUESTIONS = db_load_questions()
-            manager.game_state["total_questions"] = len(QUESTIONS)
+            registry.set_question_count(await db_count_questions())
 
-            return JSONResponse(content={"message": "Question ajoutée avec succès", "question": new_question})
+            return JSONResponse(content={
+                "message": "Question ajoutée avec succès",
+                "question": new_question,
+                "possible_duplicates": possible_duplicates
+            })
 
         logging.error(f"Failed to insert question into DB, payload: {data}")
         raise HTTPException(status_code=500, detail="Erreur lors de l'ajout en base")
@@ -513,51 +1076,158 @@ async def add_question(request: Request, payload: dict | None = Body(None)):
         logging.exception("Unexpected error in /api/questions")
         raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
 
-# API pour obtenir toutes les questions
+# Champs projetables et taille max d'une page de GET /api/questions
+QUESTION_FIELDS = ("id", "image", "question", "answer")
+QUESTIONS_PAGE_MAX = 1000
+
+# API pour obtenir les questions : toutes, ou par page avec ?after_id=...&limit=...,
+# et seulement certains champs avec ?fields=id,question
 @app.get("/api/questions")
-async def get_questions():
-    questions = db_load_questions()
-    return JSONResponse(content=questions)
+async def get_questions(request: Request, after_id: int = 0, limit: int | None = None, fields: str | None = None):
+    projection = None
+    if fields:
+        requested = {f.strip() for f in fields.split(",") if f.strip()}
+        projection = [f for f in QUESTION_FIELDS if f in requested]
+        if not projection or requested - set(QUESTION_FIELDS):
+            raise HTTPException(status_code=400, detail=f"Champs possibles : {', '.join(QUESTION_FIELDS)}")
+        if "id" not in projection:
+            projection.insert(0, "id")  # nécessaire pour demander la page suivante
+
+    # ETag lu avant les données : au pire le client revalidera une fois de trop
+    etag = get_questions_etag()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    if limit is None:
+        questions = await db_load_questions()
+    else:
+        limit = max(1, min(limit, QUESTIONS_PAGE_MAX))
+        # Une question de plus pour savoir s'il existe une page suivante
+        questions = await db_get_questions_page(after_id, limit + 1)
+        if len(questions) > limit:
+            questions = questions[:limit]
+            headers["X-Next-Cursor"] = str(questions[-1]["id"])
+    headers["X-Total-Count"] = str(await db_count_questions())
+
+    if projection is not None:
+        questions = [{f: q[f] for f in projection} for q in questions]
+    return JSONResponse(content=questions, headers=headers)
+
+# Recherche plein texte et approximative dans les questions et les réponses
+@app.get("/api/questions/search")
+async def search_questions(q: str, limit: int = 20, offset: int = 0):
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Paramètre 'q' vide")
+    results, total = await question_search.asearch(q.strip()[:200], limit, offset)
+    return JSONResponse(content={"query": q, "total": total, "results": results})
+
+# Import en flux (NDJSON ou tableau JSON dans le corps de la requête), validé par lots
+@app.post("/api/questions/import")
+async def import_questions_api(request: Request, chunk_size: int = TRANSFER_CHUNK_SIZE, skip_duplicates: bool = True):
+    def progress(stats):
+        logging.info(f"Import de questions: {stats}")
 
-# API pour supprimer toutes les questions (reset)
+    try:
+        stats = await aimport_questions(
+            aiter_questions(request.stream()),
+            chunk_size=max(1, min(chunk_size, 10000)),
+            skip_duplicates=skip_duplicates,
+            on_progress=progress
+        )
+    except ImportFailed as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except TransferError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        # Les lots déjà validés comptent, même si l'import s'est arrêté en route
+        registry.set_question_count(await db_count_questions())
+
+    return JSONResponse(content={"message": f"Import terminé : {stats}", **stats.as_dict()})
+
+# Export en flux de toutes les questions (?format=ndjson ou json)
+@app.get("/api/questions/export")
+async def export_questions_api(format: str = "ndjson"):
+    if format not in TRANSFER_FORMATS:
+        raise HTTPException(status_code=400, detail="Format inconnu (ndjson ou json)")
+    return StreamingResponse(
+        aexport_questions(format),
+        media_type=TRANSFER_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="questions.{format}"'}
+    )
+
+# API pour supprimer toutes les questions (reset), ou seulement celles de `ids` (ex. ?ids=1,2,3)
 @app.delete("/api/questions")
-async def delete_all_questions():
-    questions = db_load_questions()
-    for q in questions:
-        db_delete_question(q["id"])
+async def delete_all_questions(ids: str | None = None):
+    if ids is not None:
+        try:
+            question_ids = [int(i) for i in ids.split(",") if i.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Paramètre 'ids' invalide")
+        # Une seule transaction, quel que soit le nombre d'ids
+        deleted = await db_delete_questions(question_ids)
+        registry.set_question_count(await db_count_questions())
+        return JSONResponse(content={"message": f"{deleted} question(s) supprimée(s)", "deleted": deleted})
+
+    if not await db_delete_all_questions():
+        raise HTTPException(status_code=500, detail="Erreur lors de la suppression des questions")
 
-    global QUESTIONS
-    QUESTIONS = []
-    manager.game_state["total_questions"] = 0
+    registry.set_question_count(0)
 
     return JSONResponse(content={"message": "Toutes les questions ont été supprimées"})
 
 # ✨ NOUVEAU : API pour supprimer une question spécifique (avec PostgreSQL/Neon)
 @app.delete("/api/questions/{question_id}")
 async def delete_question_api(question_id: int):
-    success = db_delete_question(question_id)
+    success = await db_delete_question(question_id)
 
     if success:
-        global QUESTIONS
-        QUESTIONS = db_load_questions()
-        manager.game_state["total_questions"] = len(QUESTIONS)
+        registry.set_question_count(await db_count_questions())
 
         return JSONResponse(content={"message": "Question supprimée"})
     else:
         raise HTTPException(status_code=404, detail="Question non trouvée")
 
-# API pour reset le jeu
+# API pour lister les salles actives
+@app.get("/api/rooms")
+async def list_rooms():
+    return JSONResponse(content=[
+        {
+            "id": room.room_id,
+            "players": len(room.active_connections),
+            "game_started": room.game_state.game_started
+        }
+        for room in registry.rooms.values()
+    ])
+
+# Métriques au format Prometheus
+@app.get("/metrics")
+async def get_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# API pour reset le jeu d'une salle
 @app.post("/api/reset-game")
-async def reset_game():
-    manager.reset_game()
+async def reset_game(room_id: str = DEFAULT_ROOM):
+    manager = registry.get(room_id)
+    if manager is None:
+        raise HTTPException(status_code=404, detail="Salle introuvable")
+    await manager.reset_game()
+    await manager.publish("reset")
     await manager.broadcast({
         "type": "game_reset",
         "message": "Le jeu a été réinitialisé"
     })
     return JSONResponse(content={"message": "Jeu réinitialisé"})
 
+# Fichiers statiques précompressés, servis depuis la mémoire avec ETag et URLs fingerprintées
+static_cache = StaticAssetCache("static")
+
 @app.get("/")
-async def get():
+async def get(request: Request):
+    response = static_cache.index_response(request.headers, request.method)
+    if response is not None:
+        return response
     try:
         with open("static/index.html", "r", encoding="utf-8") as f:
             return HTMLResponse(content=f.read())
@@ -565,60 +1235,52 @@ async def get():
         return HTMLResponse(content="<h1>Erreur: fichier index.html introuvable</h1>", status_code=404)
 
 @app.websocket("/ws/{player_id}")
-async def websocket_endpoint(websocket: WebSocket, player_id: str):
-    await manager.connect(websocket, player_id)
-
-    # Envoyer le statut de préparation et le nombre total de questions
-    await manager.send_personal_message(json.dumps({
-        "type": "ready_status",
-        "ready_count": len(manager.game_state["ready_players"]),
-        "total_count": len(manager.active_connections),
-        "total_questions": manager.game_state["total_questions"]
-    }), websocket)
-
-    # Si le jeu est en cours, envoyer la question actuelle au nouveau joueur
-    if manager.game_state["game_started"]:
-        current_question = manager.get_current_question()
-        if current_question:
-            # Envoyer d'abord le signal de démarrage du jeu
-            await manager.send_personal_message(json.dumps({
-                "type": "game_start",
-                "total_questions": manager.game_state["total_questions"]
-            }), websocket)
-
-            # Puis envoyer la question en cours
-            await manager.send_personal_message(json.dumps({
-                "type": "question",
-                "data": current_question,
-                "question_number": manager.game_state["current_question_index"] + 1,
-                "total_questions": manager.game_state["total_questions"]
-            }), websocket)
-
-            # Envoyer le leaderboard actuel
-            await manager.send_personal_message(json.dumps({
-                "type": "leaderboard_update",
-                "leaderboard": [
-                    {
-                        "name": player["name"],
-                        "score": player["score"],
-                        "last_answer": player.get("last_answer", ""),
-                        "answered": player.get("answered", False)
-                    }
-                    for player in sorted(
-                        manager.game_state["players"].values(),
-                        key=lambda x: x["score"],
-                        reverse=True
-                    )
-                ]
-            }), websocket)
-
+async def legacy_websocket_endpoint(websocket: WebSocket, player_id: str):
+    """Ancienne URL sans salle : on rejoint la salle par défaut"""
+    await websocket_endpoint(websocket, DEFAULT_ROOM, player_id)
+
+@app.websocket("/ws/{room_id}/{player_id}")
+async def websocket_endpoint(websocket: WebSocket, room_id: str, player_id: str):
+    manager = registry.get_or_create(room_id) if ROOM_ID_PATTERN.match(room_id) else None
+    if manager is None:
+        await websocket.close(code=1008)
+        return
+
+    # Reprise de session : dernier numéro de message reçu et époque de la salle
+    last_seq = websocket.query_params.get("last_seq", "")
+    connection, replayed = await manager.connect(
+        websocket, player_id,
+        int(last_seq) if last_seq.isdigit() else None,
+        websocket.query_params.get("epoch")
+    )
+    if not replayed:
+        await manager.send_snapshot(player_id)
+
+    guard = InboundGuard()
     try:
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
-
-            if message["type"] == "answer":
-                result = await manager.check_answer(player_id, message["answer"], message.get("time_left", 0))
+            # Frame texte ou binaire quel que soit le codec négocié : un client msgpack peut
+            # envoyer du JSON texte, et un frame inattendu est refusé par le guard, pas par Starlette
+            event = await websocket.receive()
+            if event["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(event.get("code", 1000))
+            if connection.closed:
+                # Remplacée par une connexion plus récente du même joueur : ne plus agir pour lui
+                break
+            data = event.get("text")
+            if data is None:
+                data = event.get("bytes")
+            if data is None:
+                continue
+            connection.touch()
+            # Taille, schéma et débit vérifiés avant tout traitement
+            message = guard.parse(data, connection.codec)
+            if message is None:
+                continue
+            started = time.perf_counter()
+
+            if message.type == "answer":
+                result = await manager.check_answer(player_id, message.answer)
                 response = {
                     "type": "answer_result",
                     "correct": result["correct"],
@@ -626,23 +1288,47 @@ async def websocket_endpoint(websocket: WebSocket, player_id: str):
                 }
                 if "points" in result:
                     response["points"] = result["points"]
-                await manager.send_personal_message(json.dumps(response), websocket)
-
-            elif message["type"] == "set_name":
-                if player_id in manager.game_state["players"]:
-                    manager.game_state["players"][player_id]["name"] = message["name"]
+                    response["rank"] = result["rank"]
+                await manager.send_personal_message(response, player_id)
+
+            elif message.type == "set_name":
+                if player_id in manager.game_state.players:
+                    manager.game_state.players[player_id].name = message.name
+                    manager.leaderboard.update(player_id)
+                    await manager.publish_player(player_id)
                     await manager.broadcast_leaderboard()
 
-            elif message["type"] == "ready":
+            elif message.type == "ready":
                 await manager.player_ready(player_id)
 
+            elif message.type == "image_loaded":
+                await manager.image_loaded(player_id, message.question_number, message.load_ms, message.source)
+
+            kind = message.type if message.type in HANDLED_MESSAGE_TYPES else "other"
+            metrics.ws_handler_seconds.labels(kind).observe(time.perf_counter() - started)
+
+    except AbusiveClient as e:
+        logging.warning(f"Joueur {player_id} déconnecté pour abus: {e}")
+        metrics.guard_disconnects_total.labels(str(e)).inc()
+        connection.close()
+        try:
+            await websocket.close(code=1008)
+        except Exception:
+            pass
     except WebSocketDisconnect:
-        await manager.disconnect(player_id)
-        await manager.broadcast_leaderboard()
+        pass
+    finally:
+        if manager.active_connections.get(player_id) is connection:
+            await manager.disconnect(player_id, connection)
+        manager.last_activity = time.monotonic()
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", static_cache, name="static")
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=False)
\ No newline at end of file
+    # Plusieurs workers : utiliser BACKPLANE=postgres pour qu'une salle puisse être partagée
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    # Les frames plus gros que la limite du garde sont refusés dès le protocole
+    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=False, workers=workers,
+                ws_max_size=WS_MAX_FRAME_BYTES * 4)
\ No newline at end of file
@@ -0,0 +1,236 @@
+"""Métriques au format texte Prometheus, exposées sur `/metrics`.
+
+Implémentation minimale (compteurs, jauges, histogrammes avec labels) sans
+dépendance : une observation coûte un lookup de dict et une bisection, ce qui
+permet de la laisser active en pleine charge. Les jauges dont la valeur se lit
+ailleurs (joueurs, timers...) sont calculées au moment du scrape via une fonction.
+"""
+import functools
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+_metrics: List["_Metric"] = []
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        _metrics.append(self)
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        return self.labels()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+    def _render_child(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._default().dec(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        """Valeur calculée à chaque scrape plutôt que maintenue en continu"""
+        self.function = function
+
+    def render(self) -> List[str]:
+        if self.function is not None:
+            self.set(self.function())
+        return super().render()
+
+    def _render_child(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _render_child(self, values, child):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, ("le", _format_value(bound)))
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+def render() -> str:
+    """Toutes les métriques au format d'exposition texte Prometheus"""
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Métriques de l'application ---
+
+ws_handler_seconds = Histogram(
+    "partygame_ws_handler_seconds", "Durée de traitement d'un message WebSocket entrant", ["type"])
+broadcast_seconds = Histogram(
+    "partygame_broadcast_seconds", "Durée de la mise en file d'un broadcast pour tous les clients d'une salle")
+broadcast_frame_bytes = Histogram(
+    "partygame_broadcast_frame_bytes", "Taille des frames diffusés (codec par défaut)", ["type"], buckets=SIZE_BUCKETS)
+db_call_seconds = Histogram(
+    "partygame_db_call_seconds", "Durée des appels à la base par fonction", ["function"])
+upload_seconds = Histogram(
+    "partygame_upload_seconds", "Durée des uploads d'images", buckets=LATENCY_BUCKETS + (30, 60))
+uploads_total = Counter(
+    "partygame_uploads_total", "Images uploadées, nouvelles ou déjà connues (dédupliquées)", ["result"])
+image_load_seconds = Histogram(
+    "partygame_image_load_seconds", "Chargement des images mesuré par les clients (préchargement ou à l'affichage)",
+    ["source"], buckets=LATENCY_BUCKETS + (30,))
+search_seconds = Histogram(
+    "partygame_search_seconds", "Durée des recherches de questions par moteur", ["backend", "operation"])
+inbound_rejected_total = Counter(
+    "partygame_inbound_rejected_total", "Messages WebSocket entrants refusés (invalides, trop gros, débit dépassé)", ["reason"])
+guard_disconnects_total = Counter(
+    "partygame_guard_disconnects_total", "Clients déconnectés pour abus (code 1008)", ["reason"])
+reaped_connections_total = Counter(
+    "partygame_reaped_connections_total", "Connexions fermées faute de réponse au heartbeat")
+client_evictions_total = Counter(
+    "partygame_client_evictions_total", "Clients déconnectés car trop en retard", ["reason"])
+
+rooms = Gauge("partygame_rooms", "Salles actives")
+players = Gauge("partygame_players", "Joueurs dans les salles de ce worker")
+ready_players = Gauge("partygame_ready_players", "Joueurs prêts dans les salles de ce worker")
+connections = Gauge("partygame_ws_connections", "Connexions WebSocket ouvertes sur ce worker")
+outbound_queue_max = Gauge(
+    "partygame_outbound_queue_max", "Plus longue file d'envoi d'un client (retard du client le plus lent)")
+active_timers = Gauge("partygame_active_timers", "Timers de jeu programmés")
+
+
+def timed(histogram: Histogram):
+    """Décorateur : mesure la durée de chaque appel, étiquetée par le nom de la fonction"""
+    def decorator(fn):
+        child = histogram.labels(fn.__name__)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,107 @@
+"""État d'une salle sous forme de classes compactes (`__slots__`).
+
+Un joueur est un `Player` plutôt qu'un dict : attributs fixes, sans dict par
+instance, ce qui réduit la mémoire des salles de plusieurs centaines de joueurs.
+Les entrées de classement et de statut prêt sont produites directement depuis
+ces objets. Une `Question` garde un `AnswerMatcher` (réponses acceptées compilées,
+voir `answers.py`) et le contenu envoyé aux clients (sans la réponse), calculés
+une seule fois au chargement.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Set
+
+from answers import AnswerMatcher
+from scheduler import TimerHandle
+
+
+@dataclass(slots=True)
+class Player:
+    name: str
+    score: int = 0
+    last_answer: str = ""
+    answered: bool = False
+    # False pendant le délai de reprise de session
+    connected: bool = True
+    # Worker qui détient la socket du joueur
+    worker: Optional[str] = None
+    # Numéro de la question dont l'image a été préchargée
+    image_loaded: Optional[int] = None
+
+    def clear_answer(self):
+        self.last_answer = ""
+        self.answered = False
+
+    def leaderboard_entry(self, player_id: str) -> dict:
+        return {
+            "id": player_id,
+            "name": self.name,
+            "score": self.score,
+            "last_answer": self.last_answer,
+            "answered": self.answered
+        }
+
+    def status_entry(self, player_id: str, ready: bool) -> dict:
+        return {"id": player_id, "name": self.name, "ready": ready, "connected": self.connected}
+
+    def to_dict(self) -> dict:
+        """Forme sérialisable, pour le backplane"""
+        return {
+            "name": self.name,
+            "score": self.score,
+            "last_answer": self.last_answer,
+            "answered": self.answered,
+            "connected": self.connected,
+            "worker": self.worker,
+            "image_loaded": self.image_loaded
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Player":
+        return cls(
+            name=data["name"],
+            score=data.get("score", 0),
+            last_answer=data.get("last_answer", ""),
+            answered=data.get("answered", False),
+            connected=data.get("connected", True),
+            worker=data.get("worker"),
+            image_loaded=data.get("image_loaded")
+        )
+
+
+@dataclass(slots=True, eq=False)
+class Question:
+    id: int
+    image: str
+    question: str
+    answer: str
+    # Calculés une fois au chargement
+    matcher: AnswerMatcher = field(init=False)
+    payload: dict = field(init=False)
+
+    def __post_init__(self):
+        self.matcher = AnswerMatcher(self.answer)
+        # Contenu de `data` dans les messages `question` : la réponse n'est jamais envoyée
+        self.payload = {"id": self.id, "image": self.image, "question": self.question}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Question":
+        return cls(id=data["id"], image=data["image"], question=data["question"], answer=data["answer"])
+
+
+@dataclass(slots=True)
+class GameState:
+    players: Dict[str, Player] = field(default_factory=dict)
+    current_question_index: int = 0
+    # Phase courante : lobby, starting, question, reveal, waiting, preparing, advancing
+    phase: str = "lobby"
+    question_start_time: Optional[float] = None
+    # Prochaine transition de phase
+    timer_task: Optional[TimerHandle] = None
+    answered_players: Set[str] = field(default_factory=set)
+    ready_players: Set[str] = field(default_factory=set)
+    game_started: bool = False
+    total_questions: int = 0
+    # IDs des questions déjà posées
+    used_question_ids: Set[int] = field(default_factory=set)
+    # Numéro de la question dont l'image a été préchargée
+    prefetch_number: Optional[int] = None
@@ -0,0 +1,108 @@
+"""Horloge de jeu côté serveur : un seul tas de timers partagé par toutes les salles.
+
+Une unique tâche dort jusqu'à la prochaine échéance (horloge monotone) puis lance
+les callbacks arrivés à terme. Chaque timer est annulable via son `TimerHandle`
+(reset de la partie, départ de tous les joueurs...), sans tâche asyncio par timer.
+"""
+import asyncio
+import heapq
+import inspect
+import itertools
+import logging
+import time
+from typing import Callable, List, Optional, Set
+
+
+class TimerHandle:
+    __slots__ = ("deadline", "callback", "cancelled")
+
+    def __init__(self, deadline: float, callback: Callable):
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class GameScheduler:
+    def __init__(self):
+        self._heap: List[tuple] = []
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # Callbacks asynchrones en cours (référence gardée : la boucle ne garde les tâches que faiblement)
+        self._running: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def now() -> float:
+        return time.monotonic()
+
+    def call_later(self, delay: float, callback: Callable) -> TimerHandle:
+        """Programme `callback` (fonction ou coroutine) dans `delay` secondes"""
+        handle = TimerHandle(self.now() + delay, callback)
+        heapq.heappush(self._heap, (handle.deadline, next(self._counter), handle))
+        self._ensure_running()
+        if self._heap[0][2] is handle:
+            # Nouvelle échéance la plus proche : réveiller la boucle
+            self._wakeup.set()
+        return handle
+
+    @property
+    def active_timers(self) -> int:
+        return sum(1 for _, _, handle in self._heap if not handle.cancelled)
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            # Purger les timers annulés en tête
+            while self._heap and self._heap[0][2].cancelled:
+                heapq.heappop(self._heap)
+
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - self.now()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, handle = heapq.heappop(self._heap)
+            if not handle.cancelled:
+                self._fire(handle)
+
+    def _fire(self, handle: TimerHandle):
+        try:
+            result = handle.callback()
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(self._guard(result))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+        except Exception:
+            logging.exception("Erreur dans un timer de jeu")
+
+    @staticmethod
+    async def _guard(awaitable):
+        try:
+            await awaitable
+        except Exception:
+            logging.exception("Erreur dans un timer de jeu")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._heap.clear()
+
+
+game_scheduler = GameScheduler()
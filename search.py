@@ -0,0 +1,266 @@
+"""Recherche plein texte et approximative dans la banque de questions.
+
+PostgreSQL : index GIN sur un tsvector (question + réponse, configuration `french`)
+et index de trigrammes (extension pg_trgm) sur le texte de la question. Ailleurs
+(SQLite en local), ou si pg_trgm n'est pas disponible, un index de trigrammes en
+mémoire, construit depuis le cache des questions et mis à jour à chaque changement
+de version de la banque.
+
+Sert aussi à signaler les doublons probables à l'ajout d'une question.
+"""
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from answers import fold
+from database import SessionLocal, engine, get_questions_version, load_questions
+from metrics import search_seconds
+
+# postgres | memory (par défaut : postgres si la base en est une et que pg_trgm est disponible)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "")
+# Part minimale des trigrammes de la recherche présents dans la question (index mémoire)
+SEARCH_MIN_COVERAGE = float(os.getenv("SEARCH_MIN_COVERAGE", "0.5"))
+# Similarité (0-1) à partir de laquelle une question est signalée comme doublon probable
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.6"))
+SEARCH_PAGE_MAX = 100
+
+
+def trigrams(value: str) -> Set[str]:
+    """Trigrammes de chaque mot, complétés par des espaces comme pg_trgm"""
+    grams = set()
+    for word in fold(value).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _hit(question: Dict, score: float) -> Dict:
+    return {
+        "id": question["id"],
+        "image": question["image"],
+        "question": question["question"],
+        "answer": question["answer"],
+        "score": round(score, 3)
+    }
+
+
+class MemorySearchIndex:
+    """Index inversé trigramme -> ids de questions.
+
+    Chaque question garde ses trigrammes (question + réponse, et question seule pour
+    les doublons) sous forme de tableaux d'entiers compacts. Une recherche ne vérifie
+    que les questions contenant au moins un des trigrammes les plus rares de la
+    requête : une question qui en contient la proportion demandée en a forcément un
+    parmi eux."""
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._gram_ids: Dict[str, int] = {}
+        self._postings: Dict[int, Set[int]] = {}
+        # id -> (question partagée avec le cache, trigrammes question + réponse, trigrammes de la question)
+        self._docs: Dict[int, Tuple[Dict, array, array]] = {}
+
+    def _gram_array(self, grams: Set[str]) -> array:
+        gram_ids = self._gram_ids
+        return array("I", [gram_ids.setdefault(g, len(gram_ids)) for g in grams])
+
+    def _add(self, question: Dict):
+        question_id = question["id"]
+        question_grams = trigrams(question["question"])
+        grams = self._gram_array(question_grams | trigrams(question["answer"]))
+        self._docs[question_id] = (question, grams, self._gram_array(question_grams))
+        postings = self._postings
+        for gram_id in grams:
+            posting = postings.get(gram_id)
+            if posting is None:
+                posting = postings[gram_id] = set()
+            posting.add(question_id)
+
+    def _remove(self, question_id: int):
+        _, grams, _ = self._docs.pop(question_id)
+        for gram_id in grams:
+            posting = self._postings.get(gram_id)
+            if posting is not None:
+                posting.discard(question_id)
+
+    def _sync(self):
+        """Met l'index à jour si la banque a changé depuis (ajouts et suppressions seulement)"""
+        version = get_questions_version()
+        if version == self._version and self._docs:
+            return
+        questions = load_questions()
+        current = {q["id"]: q for q in questions}
+        for question_id in [i for i in self._docs if i not in current]:
+            self._remove(question_id)
+        for question_id, question in current.items():
+            if question_id not in self._docs:
+                self._add(question)
+        self._version = version
+
+    def build(self):
+        with self._lock:
+            self._sync()
+
+    def _candidates(self, grams: Set[str], coverage: float) -> Tuple[Set[int], Set[int]]:
+        """(ids candidats, trigrammes de la requête connus de l'index)"""
+        known = {self._gram_ids[g] for g in grams if g in self._gram_ids}
+        needed = max(1, math.ceil(coverage * len(grams)))
+        # Un trigramme inconnu ne figure dans aucune question : il compte parmi les plus rares
+        rarest = sorted(known, key=lambda g: len(self._postings.get(g, ())))
+        rarest = rarest[:max(0, len(grams) - needed + 1 - (len(grams) - len(known)))]
+        candidates: Set[int] = set()
+        for gram_id in rarest:
+            candidates.update(self._postings.get(gram_id, ()))
+        return candidates, known
+
+    def search(self, query: str, limit: int, offset: int) -> Tuple[List[Dict], int]:
+        grams = trigrams(query)
+        if not grams:
+            return [], 0
+        with self._lock:
+            self._sync()
+            candidates, known = self._candidates(grams, SEARCH_MIN_COVERAGE)
+            scored = []
+            for question_id in candidates:
+                question, doc_grams, _ = self._docs[question_id]
+                common = len(known.intersection(doc_grams))
+                coverage = common / len(grams)
+                if coverage >= SEARCH_MIN_COVERAGE:
+                    # Couverture de la requête d'abord, proximité globale pour départager
+                    score = 0.75 * coverage + 0.25 * 2 * common / (len(grams) + len(doc_grams))
+                    scored.append((-score, question_id, question))
+        scored.sort(key=lambda item: (item[0], item[1]))
+        return [_hit(q, -s) for s, _, q in scored[offset:offset + limit]], len(scored)
+
+    def duplicates(self, question_text: str, limit: int) -> List[Dict]:
+        grams = trigrams(question_text)
+        if not grams:
+            return []
+        with self._lock:
+            self._sync()
+            # Dice >= t avec c trigrammes communs (c <= taille de la question) implique c >= t/(2-t) * n
+            candidates, known = self._candidates(grams, DUPLICATE_THRESHOLD / (2 - DUPLICATE_THRESHOLD))
+            scored = []
+            for question_id in candidates:
+                question, _, question_grams = self._docs[question_id]
+                score = 2 * len(known.intersection(question_grams)) / (len(grams) + len(question_grams))
+                if score >= DUPLICATE_THRESHOLD:
+                    scored.append((-score, question_id, question))
+        scored.sort(key=lambda item: (item[0], item[1]))
+        return [_hit(q, -s) for s, _, q in scored[:limit]]
+
+
+# Expression indexée : les requêtes doivent utiliser exactement la même pour profiter de l'index
+_TSVECTOR = "to_tsvector('french', question || ' ' || answer)"
+
+
+class PostgresSearch:
+    name = "postgres"
+
+    @staticmethod
+    def ensure_indexes() -> bool:
+        """Crée les index (et l'extension pg_trgm). False si pg_trgm n'est pas disponible."""
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS questions_search_tsv ON questions USING GIN ({_TSVECTOR})"))
+            with engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS questions_question_trgm ON questions USING GIN (question gin_trgm_ops)"))
+            return True
+        except SQLAlchemyError as e:
+            logging.warning(f"Index de recherche PostgreSQL indisponibles ({e}) : index en mémoire")
+            return False
+
+    def search(self, query: str, limit: int, offset: int) -> Tuple[List[Dict], int]:
+        db = SessionLocal()
+        try:
+            # Total compté sur tous les résultats : une ligne (page vide) même au-delà du dernier
+            rows = db.execute(text(f"""
+                WITH hits AS (
+                    SELECT id, image, question, answer,
+                           GREATEST(
+                               word_similarity(:q, question),
+                               CASE WHEN {_TSVECTOR} @@ query THEN 0.5 + ts_rank({_TSVECTOR}, query, 32) / 2 ELSE 0 END
+                           ) AS score
+                    FROM questions, websearch_to_tsquery('french', :q) AS query
+                    WHERE {_TSVECTOR} @@ query OR :q <% question
+                ), page AS (
+                    SELECT * FROM hits ORDER BY score DESC, id LIMIT :limit OFFSET :offset
+                )
+                SELECT counted.total, page.*
+                FROM (SELECT count(*) AS total FROM hits) AS counted LEFT JOIN page ON true
+                ORDER BY page.score DESC, page.id
+            """), {"q": query, "limit": limit, "offset": offset}).mappings().all()
+            total = rows[0]["total"] if rows else 0
+            return [_hit(row, row["score"]) for row in rows if row["id"] is not None], total
+        finally:
+            db.close()
+
+    def duplicates(self, question_text: str, limit: int) -> List[Dict]:
+        db = SessionLocal()
+        try:
+            # Seuil de l'opérateur % (index trigrammes), pour cette transaction seulement
+            db.execute(text(f"SET LOCAL pg_trgm.similarity_threshold = {float(DUPLICATE_THRESHOLD)}"))
+            rows = db.execute(text("""
+                SELECT id, image, question, answer, similarity(question, :q) AS score
+                FROM questions
+                WHERE question % :q
+                ORDER BY score DESC, id
+                LIMIT :limit
+            """), {"q": question_text, "limit": limit}).mappings().all()
+            return [_hit(row, row["score"]) for row in rows]
+        finally:
+            db.rollback()
+            db.close()
+
+
+class QuestionSearch:
+    """Point d'entrée : choisit le moteur au démarrage et mesure chaque recherche"""
+
+    def __init__(self):
+        self.backend = MemorySearchIndex()
+
+    def init(self):
+        """À appeler au démarrage (bloquant : création des index ou de l'index mémoire)"""
+        wanted = SEARCH_BACKEND or ("postgres" if engine.dialect.name == "postgresql" else "memory")
+        if wanted == "postgres" and PostgresSearch.ensure_indexes():
+            self.backend = PostgresSearch()
+        else:
+            self.backend.build()
+        print(f"✅ Recherche de questions : index {self.backend.name}")
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> Tuple[List[Dict], int]:
+        """(résultats triés par pertinence, nombre total de résultats)"""
+        started = time.perf_counter()
+        try:
+            return self.backend.search(query, max(1, min(limit, SEARCH_PAGE_MAX)), max(0, offset))
+        finally:
+            search_seconds.labels(self.backend.name, "search").observe(time.perf_counter() - started)
+
+    def duplicates(self, question_text: str, limit: int = 3) -> List[Dict]:
+        """Questions existantes très proches de `question_text`"""
+        started = time.perf_counter()
+        try:
+            return self.backend.duplicates(question_text, limit)
+        finally:
+            search_seconds.labels(self.backend.name, "duplicates").observe(time.perf_counter() - started)
+
+    async def asearch(self, query: str, limit: int = 20, offset: int = 0) -> Tuple[List[Dict], int]:
+        return await asyncio.to_thread(self.search, query, limit, offset)
+
+    async def aduplicates(self, question_text: str, limit: int = 3) -> List[Dict]:
+        return await asyncio.to_thread(self.duplicates, question_text, limit)
+
+
+question_search = QuestionSearch()
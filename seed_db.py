@@ -1,47 +1,107 @@
-"""Script d'import : lit `questions.json` local et insère les questions dans PostgreSQL via `database.py`.
+"""Import / export de la banque de questions en ligne de commande, via `transfer.py`.
 Usage:
-    python seed_db.py
+    python seed_db.py                                  # importe questions.json
+    python seed_db.py import questions.ndjson          # NDJSON ou tableau JSON ("-" = stdin)
+    python seed_db.py import big.ndjson --chunk-size 5000 --allow-duplicates
+    python seed_db.py export backup.ndjson             # ("-" = stdout)
+    python seed_db.py export backup.json --format json
 
 Prérequis:
 - DATABASE_URL défini (Neon / PostgreSQL)
-- `questions.json` présent à la racine du projet
+- `questions.json` présent à la racine du projet (sans argument)
+
+Les fichiers sont lus et écrits en flux (mémoire constante), et l'import est validé
+par lots de TRANSFER_CHUNK_SIZE questions, chacun dans sa propre transaction.
 """
+import argparse
+import contextlib
 import os
-import json
-from database import save_question, load_questions
+import sys
+import time
 
 QUESTIONS_FILE = "questions.json"
 
-if __name__ == "__main__":
-    if not os.getenv("DATABASE_URL"):
-        print("ERROR: DATABASE_URL n'est pas défini. Exporte ta chaîne de connexion vers Neon.")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Import / export des questions du Party Game")
+    commands = parser.add_subparsers(dest="command")
+
+    import_parser = commands.add_parser("import", help="importe un fichier NDJSON ou un tableau JSON")
+    import_parser.add_argument("file", nargs="?", default=QUESTIONS_FILE, help="fichier à importer (- = stdin)")
+    import_parser.add_argument("--chunk-size", type=int, help="questions par transaction")
+    import_parser.add_argument("--allow-duplicates", action="store_true",
+                               help="insère aussi les questions déjà présentes (même question et réponse)")
+
+    export_parser = commands.add_parser("export", help="exporte toutes les questions")
+    export_parser.add_argument("file", help="fichier de sortie (- = stdout)")
+    export_parser.add_argument("--format", choices=["ndjson", "json"], default="ndjson")
+
+    args = parser.parse_args()
+    if args.command is None:
+        # Ancien usage : `python seed_db.py` importe questions.json
+        args = import_parser.parse_args([])
+        args.command = "import"
+    return args
+
+
+def run_import(args):
+    from transfer import TRANSFER_CHUNK_SIZE, TransferError, import_questions, iter_questions
+
+    if args.file != "-" and not os.path.exists(args.file):
+        print(f"ERROR: {args.file} introuvable")
         raise SystemExit(1)
 
-    if not os.path.exists(QUESTIONS_FILE):
-        print(f"ERROR: {QUESTIONS_FILE} introuvable")
+    started = time.monotonic()
+
+    def progress(stats):
+        rate = stats.read / max(time.monotonic() - started, 1e-6)
+        print(f"… {stats} ({rate:.0f}/s)", file=sys.stderr)
+
+    stream = sys.stdin if args.file == "-" else open(args.file, "r", encoding="utf-8")
+    try:
+        stats = import_questions(
+            iter_questions(stream),
+            chunk_size=args.chunk_size or TRANSFER_CHUNK_SIZE,
+            skip_duplicates=not args.allow_duplicates,
+            on_progress=progress
+        )
+    except TransferError as e:
+        print(f"ERROR: {e}")
         raise SystemExit(1)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
 
-    with open(QUESTIONS_FILE, "r", encoding="utf-8") as f:
-        questions = json.load(f)
+    print(f"Done. {stats} en {time.monotonic() - started:.1f}s.")
+    print("→ Vérifie dans Neon (ou via load_questions())")
 
-    inserted = 0
-    for q in questions:
-        # Eviter d'insérer les champs points si présents
-        image = q.get("image")
-        question_text = q.get("question")
-        answer = q.get("answer")
 
-        if not image or not question_text or not answer:
-            print(f"Skip question (manque de champs): {q}")
-            continue
+def run_export(args):
+    # Les messages affichés à la connexion à la base ne doivent pas se mêler à l'export sur stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        from transfer import TransferError, export_questions
 
-        result = save_question(image=image, question_text=question_text, answer=answer)
-        if result:
-            inserted += 1
-            print(f"Inserted ID={result['id']}")
-        else:
-            print(f"Failed to insert: {q}")
+    stream = sys.stdout if args.file == "-" else open(args.file, "w", encoding="utf-8")
+    try:
+        for text in export_questions(args.format):
+            stream.write(text)
+    except TransferError as e:
+        print(f"ERROR: {e} : export incomplet", file=sys.stderr)
+        raise SystemExit(1)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    if stream is not sys.stdout:
+        print(f"Done. Questions exportées dans {args.file}.")
 
-    print(f"Done. {inserted} questions insérées.")
-    print("→ Vérifie dans Neon (ou via load_questions())")
 
+if __name__ == "__main__":
+    args = parse_args()
+    if not os.getenv("DATABASE_URL"):
+        print("ERROR: DATABASE_URL n'est pas défini. Exporte ta chaîne de connexion vers Neon.")
+        raise SystemExit(1)
+
+    if args.command == "export":
+        run_export(args)
+    else:
+        run_import(args)
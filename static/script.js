@@ -1,5 +1,17 @@
-// Générer un ID unique pour le joueur
-const playerId = 'player_' + Math.random().toString(36).substr(2, 9);
+// ID unique du joueur, gardé pour l'onglet : une reconnexion reprend la même session (score, nom)
+const playerId = sessionStorage.getItem('playerId') || 'player_' + Math.random().toString(36).substr(2, 9);
+sessionStorage.setItem('playerId', playerId);
+
+// Reprise de session : époque de la salle et numéro du dernier message reçu
+let sessionEpoch = null;
+let lastSeq = null;
+
+// Heartbeat : sans nouvelles du serveur pendant 3 intervalles, on force la reconnexion
+let heartbeatInterval = 15;
+let heartbeatWatchdog = null;
+
+// Salle de jeu : ?room=xxx dans l'URL, sinon la salle par défaut
+const roomId = new URLSearchParams(window.location.search).get('room') || 'default';
 
 // Connexion WebSocket
 let ws;
@@ -12,6 +24,12 @@ let gameStarted = false;
 let playerName = null;
 let isAdmin = false;
 
+// Classement : entrées par id de joueur, mises à jour par les deltas du serveur
+const leaderboardEntries = new Map();
+
+// Image de la question suivante, préchargée pendant la révélation (gardée pour rester en cache)
+let prefetchedImage = null;
+
 // Système de détection d'inactivité
 let inactivityTimer = null;
 let lastActivityTime = Date.now();
@@ -97,6 +115,13 @@ function revokeAdminStatus() {
     isAdmin = false;
 }
 
+// Longueur max d'un nom (le serveur tronque au-delà)
+const NAME_MAX_LENGTH = 32;
+
+function cleanPlayerName(name) {
+    return name.trim().slice(0, NAME_MAX_LENGTH).trim();
+}
+
 // Fonction pour sauvegarder le nom dans localStorage
 function savePlayerName(name) {
     localStorage.setItem('playerName', name);
@@ -127,7 +152,11 @@ function updatePlayerNameDisplay() {
 function connect() {
     // Auto-détecte si on est en local (ws://) ou en prod (wss://)
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    const wsUrl = `${protocol}//${window.location.host}/ws/${playerId}`;
+    let wsUrl = `${protocol}//${window.location.host}/ws/${encodeURIComponent(roomId)}/${playerId}`;
+    if (sessionEpoch !== null && lastSeq !== null) {
+        // Le serveur renverra seulement les messages manqués pendant la coupure
+        wsUrl += `?last_seq=${lastSeq}&epoch=${sessionEpoch}`;
+    }
     ws = new WebSocket(wsUrl);
 
     ws.onopen = () => {
@@ -140,21 +169,33 @@ function connect() {
     };
 
     ws.onmessage = (event) => {
+        resetHeartbeatWatchdog();
         const message = JSON.parse(event.data);
+        if (typeof message.seq === 'number') {
+            lastSeq = Math.max(lastSeq ?? 0, message.seq);
+        }
         handleMessage(message);
     };
 
-    ws.onclose = () => {
+    ws.onclose = (event) => {
         console.log('Déconnecté du serveur');
         isConnected = false;
         updateConnectionStatus(false);
 
+        clearTimeout(heartbeatWatchdog);
+
         // Arrêter le timer d'inactivité
         if (inactivityTimer) {
             clearTimeout(inactivityTimer);
             inactivityTimer = null;
         }
 
+        // Session reprise dans un autre onglet : ne pas la lui reprendre en boucle
+        if (event.code === 4000) {
+            document.getElementById('status-text').textContent = 'Ouvert dans un autre onglet';
+            return;
+        }
+
         // Reconnecter après 3 secondes
         setTimeout(connect, 3000);
     };
@@ -164,9 +205,38 @@ function connect() {
     };
 }
 
+function resetHeartbeatWatchdog() {
+    clearTimeout(heartbeatWatchdog);
+    if (heartbeatInterval > 0) {
+        heartbeatWatchdog = setTimeout(() => {
+            console.log('Serveur muet - Reconnexion...');
+            // onclose relance la connexion (avec reprise de session)
+            ws.close();
+        }, heartbeatInterval * 3 * 1000);
+    }
+}
+
 // Gestion des messages du serveur
 function handleMessage(message) {
     switch (message.type) {
+        case 'ping':
+            ws.send(JSON.stringify({ type: 'pong' }));
+            break;
+
+        case 'session':
+            sessionEpoch = message.epoch;
+            heartbeatInterval = message.heartbeat || 0;
+            resetHeartbeatWatchdog();
+            if (!message.resumed) {
+                // État complet à suivre : repartir du numéro courant
+                lastSeq = message.seq;
+                // Session neuve (délai de grâce dépassé) : renvoyer le nom
+                if (playerName && ws.readyState === WebSocket.OPEN) {
+                    ws.send(JSON.stringify({ type: 'set_name', name: playerName }));
+                }
+            }
+            break;
+
         case 'ready_status':
             updateReadyStatus(message.ready_count, message.total_count, message.players);
             if (message.total_questions) {
@@ -178,9 +248,14 @@ function handleMessage(message) {
             startGame(message.total_questions);
             break;
 
+        case 'prefetch':
+            prefetchImage(message.image, message.question_number);
+            break;
+
         case 'question':
             displayQuestion(message.data, message.question_number, message.total_questions);
-            startTimer(10);
+            // Le serveur fait foi : durée et temps restant (utile si on rejoint en cours de question)
+            startTimer(message.time_left ?? message.duration ?? 10);
             canAnswer = true;
             // Réactiver l'input pour la nouvelle question
             document.getElementById('answer-input').disabled = false;
@@ -192,7 +267,14 @@ function handleMessage(message) {
             break;
 
         case 'leaderboard_update':
-            updateLeaderboard(message.leaderboard);
+            // Classement complet : on repart de zéro
+            leaderboardEntries.clear();
+            message.leaderboard.forEach(entry => leaderboardEntries.set(entry.id, entry));
+            renderLeaderboard();
+            break;
+
+        case 'leaderboard_delta':
+            applyLeaderboardDelta(message);
             break;
 
         case 'answer_result':
@@ -386,6 +468,37 @@ function startGame(totalQuestions) {
     document.getElementById('total-questions').textContent = totalQuestions;
 }
 
+// URL complète (http://, https://), chemin absolu (/static/assets/... renvoyé par l'upload)
+// ou simple nom de fichier local
+function imageUrl(image) {
+    if (image.startsWith('http://') || image.startsWith('https://') || image.startsWith('/')) {
+        return image;
+    }
+    return `/static/assets/${image}`;
+}
+
+// Précharger l'image de la prochaine question et prévenir le serveur quand elle est prête
+function prefetchImage(image, questionNumber) {
+    if (!image) return;
+    const startedAt = performance.now();
+    const img = new Image();
+    // En cas d'erreur aussi : inutile que le serveur attende cette image
+    img.onload = img.onerror = () => sendImageLoaded(questionNumber, startedAt, 'prefetch');
+    img.src = imageUrl(image);
+    prefetchedImage = img;
+}
+
+function sendImageLoaded(questionNumber, startedAt, source) {
+    if (ws && ws.readyState === WebSocket.OPEN) {
+        ws.send(JSON.stringify({
+            type: 'image_loaded',
+            question_number: questionNumber,
+            load_ms: Math.round(performance.now() - startedAt),
+            source: source
+        }));
+    }
+}
+
 // Afficher une question
 function displayQuestion(question, questionNumber, totalQuestions) {
     const questionImage = document.getElementById('question-image');
@@ -393,12 +506,10 @@ function displayQuestion(question, questionNumber, totalQuestions) {
     const currentQuestionSpan = document.getElementById('current-question');
 
     if (question.image) {
-        // Vérifier si c'est une URL complète (http:// ou https://) ou un fichier local
-        if (question.image.startsWith('http://') || question.image.startsWith('https://')) {
-            questionImage.src = question.image;
-        } else {
-            questionImage.src = `/static/assets/${question.image}`;
-        }
+        // Mesurer l'affichage de l'image (quasi immédiat si elle a été préchargée)
+        const startedAt = performance.now();
+        questionImage.onload = () => sendImageLoaded(questionNumber, startedAt, 'question');
+        questionImage.src = imageUrl(question.image);
     }
 
     if (question.question) {
@@ -481,6 +592,26 @@ function showGameOver(message, winner) {
     showRestartModal();
 }
 
+// Appliquer un delta du classement (seules les entrées modifiées sont envoyées)
+function applyLeaderboardDelta(delta) {
+    if (delta.clear_answers) {
+        leaderboardEntries.forEach(entry => {
+            entry.last_answer = '';
+            entry.answered = false;
+        });
+    }
+    (delta.removed || []).forEach(id => leaderboardEntries.delete(id));
+    (delta.changed || []).forEach(entry => leaderboardEntries.set(entry.id, entry));
+    renderLeaderboard();
+}
+
+// Afficher le classement trié par score
+function renderLeaderboard() {
+    const leaderboard = Array.from(leaderboardEntries.values());
+    leaderboard.sort((a, b) => b.score - a.score);
+    updateLeaderboard(leaderboard);
+}
+
 // Mettre à jour le leaderboard
 function updateLeaderboard(leaderboard) {
     const leaderboardList = document.getElementById('leaderboard-list');
@@ -559,11 +690,10 @@ function submitAnswer() {
         return;
     }
 
-    // Envoyer la réponse au serveur avec le temps restant
+    // Envoyer la réponse au serveur (les points sont calculés avec l'horloge du serveur)
     ws.send(JSON.stringify({
         type: 'answer',
-        answer: answer,
-        time_left: timeLeft
+        answer: answer
     }));
 
     // Vider le champ pour permettre une nouvelle tentative
@@ -646,9 +776,9 @@ document.addEventListener('DOMContentLoaded', () => {
             return;
         }
 
-        const newName = prompt('Entrez votre nouveau nom:', playerName || '');
-        if (newName && newName.trim() && newName.trim() !== playerName) {
-            savePlayerName(newName.trim());
+        const newName = cleanPlayerName(prompt('Entrez votre nouveau nom:', playerName || '') || '');
+        if (newName && newName !== playerName) {
+            savePlayerName(newName);
 
             // Envoyer le nouveau nom au serveur
             if (isConnected && ws.readyState === WebSocket.OPEN) {
@@ -682,14 +812,14 @@ window.addEventListener('load', () => {
 
         if (savedName && savedName.trim()) {
             // Utiliser le nom sauvegardé
-            playerName = savedName.trim();
+            playerName = cleanPlayerName(savedName);
             console.log('Nom récupéré du localStorage:', playerName);
             updatePlayerNameDisplay();
         } else {
             // Demander un nouveau nom
-            const newName = prompt('Entrez votre nom:', `Joueur ${Math.floor(Math.random() * 1000)}`);
-            if (newName && newName.trim()) {
-                savePlayerName(newName.trim());
+            const newName = cleanPlayerName(prompt('Entrez votre nom:', `Joueur ${Math.floor(Math.random() * 1000)}`) || '');
+            if (newName) {
+                savePlayerName(newName);
             }
         }
 
@@ -711,40 +841,57 @@ window.addEventListener('load', () => {
     }, 500); // Attendre un peu que la connexion soit établie
 });
 
+// Liste des questions chargée par pages (sans les réponses), la suite à la demande
+const QUESTIONS_PAGE_SIZE = 100;
+let questionsNextCursor = null;
+
+function questionItemElement(question) {
+    const questionItem = document.createElement('div');
+    questionItem.className = 'question-item';
+    questionItem.innerHTML = `
+        <div class="question-content">
+            <span class="question-number">#${question.id}</span>
+            <span>${question.question}</span>
+            <span class="question-answer">🔒 Réponse cachée</span>
+        </div>
+        <button class="delete-question-btn" onclick="deleteQuestion(${question.id})">🗑️</button>
+    `;
+    return questionItem;
+}
+
+// Une page de questions : { questions, total, next } (le navigateur revalide avec l'ETag)
+async function fetchQuestionsPage(afterId, limit, fields) {
+    const response = await fetch(`/api/questions?after_id=${afterId}&limit=${limit}&fields=${fields}`);
+    return {
+        questions: await response.json(),
+        total: parseInt(response.headers.get('X-Total-Count') || '0', 10),
+        next: response.headers.get('X-Next-Cursor')
+    };
+}
+
 // Charger les questions existantes depuis le serveur
 async function loadQuestions() {
     try {
-        const response = await fetch('/api/questions');
-        const questions = await response.json();
-
         const questionsCount = document.getElementById('questions-count');
         const questionsItems = document.getElementById('questions-items');
 
-        questionsCount.textContent = questions.length;
-
         // Vérifier si l'utilisateur est admin
         if (isAdmin) {
-            // Admin : afficher la liste complète avec réponses cachées
+            // Admin : afficher la première page, réponses cachées
+            const page = await fetchQuestionsPage(0, QUESTIONS_PAGE_SIZE, 'id,question');
+            questionsCount.textContent = page.total;
             questionsItems.innerHTML = '';
-            questions.forEach(question => {
-                const questionItem = document.createElement('div');
-                questionItem.className = 'question-item';
-                questionItem.innerHTML = `
-                    <div class="question-content">
-                        <span class="question-number">#${question.id}</span>
-                        <span>${question.question}</span>
-                        <span class="question-answer">🔒 Réponse cachée</span>
-                    </div>
-                    <button class="delete-question-btn" onclick="deleteQuestion(${question.id})">🗑️</button>
-                `;
-                questionsItems.appendChild(questionItem);
-            });
+            page.questions.forEach(question => questionsItems.appendChild(questionItemElement(question)));
+            questionsNextCursor = page.next;
+            updateLoadMoreButton();
         } else {
-            // Joueur normal : message indiquant qu'il faut être admin
+            // Joueur normal : seul le nombre total est utile
+            const page = await fetchQuestionsPage(0, 1, 'id');
+            questionsCount.textContent = page.total;
             questionsItems.innerHTML = `
                 <div class="admin-message">
                     <p>🔒 Seul l'administrateur peut voir les questions</p>
-                    <p class="admin-hint">Nombre total : ${questions.length} question(s)</p>
+                    <p class="admin-hint">Nombre total : ${page.total} question(s)</p>
                 </div>
             `;
         }
@@ -753,6 +900,39 @@ async function loadQuestions() {
     }
 }
 
+// Ajouter la page suivante à la liste
+async function loadMoreQuestions() {
+    if (!questionsNextCursor) return;
+    try {
+        const page = await fetchQuestionsPage(questionsNextCursor, QUESTIONS_PAGE_SIZE, 'id,question');
+        const questionsItems = document.getElementById('questions-items');
+        page.questions.forEach(question => questionsItems.appendChild(questionItemElement(question)));
+        document.getElementById('questions-count').textContent = page.total;
+        questionsNextCursor = page.next;
+        updateLoadMoreButton();
+    } catch (error) {
+        console.error('Erreur lors du chargement des questions:', error);
+    }
+}
+
+function updateLoadMoreButton() {
+    const questionsItems = document.getElementById('questions-items');
+    let button = document.getElementById('load-more-questions');
+    if (!questionsNextCursor) {
+        if (button) button.remove();
+        return;
+    }
+    if (!button) {
+        button = document.createElement('button');
+        button.id = 'load-more-questions';
+        button.className = 'admin-toggle-btn';
+        button.textContent = '⬇️ Afficher plus';
+        button.onclick = loadMoreQuestions;
+    }
+    // Toujours en bas de la liste
+    questionsItems.appendChild(button);
+}
+
 // Ajouter une question
 async function addQuestion() {
     const imageInput = document.getElementById('form-question-image');
@@ -827,8 +1007,14 @@ async function addQuestion() {
             // Recharger la liste des questions
             await loadQuestions();
 
-            // Afficher un message de succès
-            showFeedback(true, 'Question ajoutée avec succès ! ✅');
+            // Afficher un message de succès (et les doublons probables signalés par le serveur)
+            const created = await questionResponse.json().catch(() => ({}));
+            const duplicates = created.possible_duplicates || [];
+            if (duplicates.length > 0) {
+                showFeedback(true, `Question ajoutée ✅ (ressemble à : « ${duplicates[0].question} »)`);
+            } else {
+                showFeedback(true, 'Question ajoutée avec succès ! ✅');
+            }
         } else {
             // Lire le corps de la réponse pour obtenir les détails d'erreur envoyés par le serveur
             const text = await questionResponse.text();
@@ -0,0 +1,180 @@
+"""Service des fichiers statiques depuis la mémoire.
+
+Au démarrage, les fichiers de `static/` sont lus une fois, compressés à l'avance
+(gzip, et brotli si le module est installé) et identifiés par une empreinte de
+contenu : ETag fort, réponse 304 sur `If-None-Match`, et URL « fingerprintée »
+(`script.<hash>.js`) mise en cache sans limite par les navigateurs. index.html est
+réécrit pour pointer vers ces URLs. Un fichier absent du cache (ex. image uploadée
+après le démarrage) est servi par `StaticFiles`.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # gzip seulement
+    brotli = None
+
+# Fichiers plus gros servis directement depuis le disque
+STATIC_PRELOAD_MAX_BYTES = int(os.getenv("STATIC_PRELOAD_MAX_BYTES", str(1024 * 1024)))
+# STATIC_CACHE=0 en développement pour voir les modifications sans redémarrer
+STATIC_CACHE = os.getenv("STATIC_CACHE", "1") != "0"
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+# Images uploadées nommées par empreinte (voir storage.py) : leur contenu ne change jamais
+CONTENT_ADDRESSED_NAME = re.compile(r"^assets/[0-9a-f]{32}(_w\d+)?\.\w+$")
+
+
+class StaticAsset:
+    __slots__ = ("content_type", "etag", "bodies", "fingerprinted")
+
+    def __init__(self, data: bytes, content_type: str, fingerprinted: str):
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        self.content_type = content_type
+        self.etag = digest
+        self.fingerprinted = fingerprinted
+        # Représentations par encodage ("identity", "gzip", "br")
+        self.bodies: Dict[str, bytes] = {"identity": data}
+        if content_type.startswith(COMPRESSIBLE_TYPES) and len(data) > 256:
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data):
+                self.bodies["gzip"] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(data, quality=11)
+                if len(compressed) < len(data):
+                    self.bodies["br"] = compressed
+
+    def encoding_for(self, accept_encoding: str) -> str:
+        accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in self.bodies and encoding in accepted:
+                return encoding
+        return "identity"
+
+
+def fingerprint_name(name: str, data: bytes) -> str:
+    stem, dot, extension = name.rpartition(".")
+    digest = hashlib.sha256(data).hexdigest()[:10]
+    return f"{stem}.{digest}.{extension}" if dot else f"{name}.{digest}"
+
+
+class StaticAssetCache:
+    """Application ASGI à monter sur /static, plus la réponse de la page d'accueil"""
+
+    def __init__(self, directory: str = "static", url_prefix: str = "/static"):
+        self.directory = Path(directory)
+        self.url_prefix = url_prefix
+        self.fallback = StaticFiles(directory=directory)
+        self.assets: Dict[str, StaticAsset] = {}
+        # URL fingerprintée -> (nom réel)
+        self.fingerprinted: Dict[str, str] = {}
+        self.index: Optional[StaticAsset] = None
+
+    def load(self):
+        """Lit et précompresse les fichiers statiques (à appeler au démarrage)"""
+        if not STATIC_CACHE:
+            return
+        assets: Dict[str, StaticAsset] = {}
+        fingerprinted: Dict[str, str] = {}
+        files: List[Tuple[str, bytes]] = []
+        for path in sorted(self.directory.rglob("*")):
+            if not path.is_file() or path.name.startswith(".") or path.stat().st_size > STATIC_PRELOAD_MAX_BYTES:
+                continue
+            files.append((path.relative_to(self.directory).as_posix(), path.read_bytes()))
+
+        for name, data in files:
+            if name == "index.html":
+                continue
+            content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            if content_type.startswith("text/") or content_type == "application/javascript":
+                content_type += "; charset=utf-8"
+            asset = StaticAsset(data, content_type, fingerprint_name(name, data))
+            assets[name] = asset
+            fingerprinted[asset.fingerprinted] = name
+
+        self.assets = assets
+        self.fingerprinted = fingerprinted
+
+        index = dict(files).get("index.html")
+        if index is not None:
+            html = self.rewrite_urls(index.decode("utf-8"))
+            self.index = StaticAsset(html.encode("utf-8"), "text/html; charset=utf-8", "index.html")
+
+        total = sum(len(a.bodies["identity"]) for a in assets.values())
+        print(f"✅ {len(assets)} fichiers statiques en cache ({total // 1024} Ko)")
+
+    def url(self, name: str) -> str:
+        """URL fingerprintée d'un fichier statique (URL simple s'il n'est pas en cache)"""
+        asset = self.assets.get(name)
+        return f"{self.url_prefix}/{asset.fingerprinted if asset else name}"
+
+    def rewrite_urls(self, html: str) -> str:
+        pattern = re.compile(r'(src|href)="' + re.escape(self.url_prefix) + r'/([^"?#]+)"')
+        return pattern.sub(lambda m: f'{m.group(1)}="{self.url(m.group(2))}"', html)
+
+    def respond(self, asset: StaticAsset, headers: Headers, cache_control: str, method: str = "GET") -> Response:
+        encoding = asset.encoding_for(headers.get("accept-encoding", ""))
+        # ETag fort propre à chaque représentation
+        etag = f'"{asset.etag}"' if encoding == "identity" else f'"{asset.etag}-{encoding}"'
+        response_headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+            return Response(status_code=304, headers=response_headers)
+
+        body = asset.bodies[encoding]
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+        response = Response(content=b"" if method == "HEAD" else body, headers=response_headers,
+                            media_type=asset.content_type)
+        response.headers["Content-Length"] = str(len(body))
+        return response
+
+    def index_response(self, headers: Headers, method: str = "GET") -> Optional[Response]:
+        if self.index is None:
+            return None
+        return self.respond(self.index, headers, REVALIDATE_CACHE, method)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.fallback(scope, receive, send)
+
+        root_path = scope.get("root_path", "")
+        path = scope["path"][len(root_path):] if scope["path"].startswith(root_path) else scope["path"]
+        name = path.lstrip("/")
+
+        asset, cache_control = None, REVALIDATE_CACHE
+        if name in self.fingerprinted:
+            asset, cache_control = self.assets[self.fingerprinted[name]], IMMUTABLE_CACHE
+        elif name in self.assets:
+            asset = self.assets[name]
+
+        if asset is None or scope["method"] not in ("GET", "HEAD"):
+            return await self.fallback(scope, receive, self._immutable_sender(name, send))
+
+        response = self.respond(asset, Headers(scope=scope), cache_control, scope["method"])
+        await response(scope, receive, send)
+
+    @staticmethod
+    def _immutable_sender(name: str, send):
+        """Ajoute le cache immuable aux images nommées par empreinte servies depuis le disque"""
+        if not CONTENT_ADDRESSED_NAME.match(name):
+            return send
+
+        async def sender(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                message["headers"] = list(message["headers"]) + [(b"cache-control", IMMUTABLE_CACHE.encode())]
+            await send(message)
+        return sender
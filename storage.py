@@ -0,0 +1,243 @@
+"""Stockage des images uploadées.
+
+Backends interchangeables (Cloudinary, disque local, mémoire pour les tests) choisis
+par `STORAGE_BACKEND`. Les appels bloquants (SDK Cloudinary, écriture disque) tournent
+dans un petit pool de threads borné pour ne jamais bloquer la boucle d'événements, et
+le fichier reçu est lu par morceaux avec une taille maximale.
+
+Les images sont rangées par empreinte de contenu (SHA-256) : un même fichier uploadé
+deux fois n'est stocké qu'une fois. À l'upload, des variantes WebP réduites sont
+générées (Pillow, optionnel) et c'est l'une d'elles qui est utilisée dans les questions.
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+import cloudinary
+import cloudinary.uploader
+import cloudinary.utils
+
+from metrics import uploads_total
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pas de variantes : l'original est servi tel quel
+    Image = None
+
+# Taille max d'une image uploadée (octets)
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(5 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Threads dédiés aux envois vers le stockage (au-delà, les uploads attendent leur tour)
+UPLOAD_THREADS = int(os.getenv("UPLOAD_THREADS", "4"))
+# cloudinary | local | memory (par défaut : cloudinary si CLOUDINARY_URL est défini)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "")
+
+# Largeurs (px) des variantes WebP générées, et largeur utilisée dans les questions
+IMAGE_VARIANT_WIDTHS = tuple(sorted(int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "480,960").split(",") if w))
+IMAGE_DISPLAY_WIDTH = int(os.getenv("IMAGE_DISPLAY_WIDTH", str(max(IMAGE_VARIANT_WIDTHS, default=0))))
+IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+
+ASSETS_DIR = Path("static/assets")
+
+EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/jpg": "jpg", "image/gif": "gif"}
+
+_upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_THREADS, thread_name_prefix="upload")
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+async def read_upload(file, max_bytes: int = UPLOAD_MAX_BYTES) -> bytes:
+    """Lit le fichier uploadé par morceaux, en s'arrêtant dès que la taille max est dépassée"""
+    buffer = bytearray()
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            return bytes(buffer)
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise UploadTooLarge(f"Image trop volumineuse (max {max_bytes // 1024} Ko)")
+
+
+def content_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def make_variants(data: bytes) -> Dict[int, bytes]:
+    """Variantes WebP par largeur (sans agrandir l'image). Vide sans Pillow ou pour un GIF animé."""
+    if Image is None or not IMAGE_VARIANT_WIDTHS:
+        return {}
+    variants: Dict[int, bytes] = {}
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            if getattr(source, "is_animated", False):
+                return {}
+            image = ImageOps.exif_transpose(source)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "transparency" in image.info or "A" in image.mode else "RGB")
+            for width in IMAGE_VARIANT_WIDTHS:
+                variant = image
+                if width < image.width:
+                    variant = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+                buffer = io.BytesIO()
+                variant.save(buffer, "WEBP", quality=IMAGE_WEBP_QUALITY, method=4)
+                variants[width] = buffer.getvalue()
+                if width >= image.width:
+                    break  # les largeurs suivantes donneraient la même image
+    except Exception as e:
+        logging.warning(f"Variantes d'image impossibles: {e}")
+        return {}
+    return variants
+
+
+def display_url(original: str, variants: Dict[int, str]) -> str:
+    """URL à mettre dans les questions : la plus grande variante ne dépassant pas IMAGE_DISPLAY_WIDTH"""
+    fitting = [w for w in variants if w <= IMAGE_DISPLAY_WIDTH]
+    if fitting:
+        return variants[max(fitting)]
+    if variants:
+        return variants[min(variants)]
+    return original
+
+
+class ImageStorage:
+    name = ""
+    message = "Image uploadée"
+
+    async def save(self, data: bytes, filename: str, content_type: str) -> Dict:
+        """Enregistre l'image (une seule fois par contenu) et ses variantes.
+        Retourne {"url", "original", "variants", "deduplicated"}."""
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(_upload_executor, self._store, data, content_type)
+        uploads_total.labels("deduplicated" if result["deduplicated"] else "stored").inc()
+        return result
+
+    def _store(self, data: bytes, content_type: str) -> Dict:
+        key = content_key(data)
+        original_name = f"{key}.{EXTENSIONS.get(content_type, 'img')}"
+        variant_names = {width: f"{key}_w{width}.webp" for width in IMAGE_VARIANT_WIDTHS}
+
+        deduplicated = self._exists(original_name)
+        if deduplicated:
+            variants = {w: self._url(name) for w, name in variant_names.items() if self._exists(name)}
+        else:
+            variants = {}
+            for width, variant in make_variants(data).items():
+                self._write(variant_names[width], variant)
+                variants[width] = self._url(variant_names[width])
+            # L'original en dernier : sa présence signifie que l'image est complète
+            self._write(original_name, data)
+
+        original = self._url(original_name)
+        return {
+            "url": display_url(original, variants),
+            "original": original,
+            "variants": variants,
+            "deduplicated": deduplicated
+        }
+
+    def _exists(self, name: str) -> bool:
+        raise NotImplementedError
+
+    def _write(self, name: str, data: bytes):
+        raise NotImplementedError
+
+    def _url(self, name: str) -> str:
+        raise NotImplementedError
+
+
+class CloudinaryStorage(ImageStorage):
+    """Cloudinary : l'empreinte sert de public_id et les variantes sont des transformations
+    générées dès l'upload (eager)."""
+    name = "cloudinary"
+    message = "Image uploadée avec succès sur Cloudinary"
+
+    def __init__(self, folder: str = "party-game-questions"):
+        self.folder = folder
+
+    def _store(self, data: bytes, content_type: str) -> Dict:
+        transformations = [
+            {"width": width, "crop": "limit", "format": "webp", "quality": IMAGE_WEBP_QUALITY}
+            for width in IMAGE_VARIANT_WIDTHS
+        ]
+        result = cloudinary.uploader.upload(
+            io.BytesIO(data),
+            folder=self.folder,
+            public_id=content_key(data),
+            overwrite=False,
+            resource_type="image",
+            eager=transformations or None,
+        )
+        variants = {}
+        if not result.get("pages", 1) > 1:  # pas de variante figée pour un GIF animé
+            # Même URL que les transformations eager, y compris quand l'image existait déjà
+            for transformation in transformations:
+                variants[transformation["width"]] = cloudinary.utils.cloudinary_url(
+                    result["public_id"], secure=True, **transformation)[0]
+        original = result["secure_url"]
+        return {
+            "url": display_url(original, variants),
+            "original": original,
+            "variants": variants,
+            "deduplicated": bool(result.get("existing"))
+        }
+
+
+class LocalStorage(ImageStorage):
+    name = "local"
+    message = "Image uploadée localement"
+
+    def __init__(self, directory: Path = ASSETS_DIR, url_prefix: str = "/static/assets/"):
+        self.directory = directory
+        self.url_prefix = url_prefix
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _exists(self, name: str) -> bool:
+        return (self.directory / name).exists()
+
+    def _write(self, name: str, data: bytes):
+        # Écriture atomique : un upload concurrent du même fichier ne voit jamais un fichier partiel
+        path = self.directory / name
+        tmp_path = path.with_name(f".{name}.{os.urandom(4).hex()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def _url(self, name: str) -> str:
+        return self.url_prefix + name
+
+
+class MemoryStorage(ImageStorage):
+    """Stockage en mémoire, pour les tests et le banc de charge"""
+    name = "memory"
+    message = "Image gardée en mémoire"
+
+    def __init__(self):
+        self.files: Dict[str, bytes] = {}
+
+    def _exists(self, name: str) -> bool:
+        return name in self.files
+
+    def _write(self, name: str, data: bytes):
+        self.files[name] = data
+
+    def _url(self, name: str) -> str:
+        return f"memory://{name}"
+
+
+def create_storage(backend: Optional[str] = None) -> ImageStorage:
+    backend = backend or STORAGE_BACKEND or ("cloudinary" if os.getenv("CLOUDINARY_URL") else "local")
+    if backend == "cloudinary":
+        return CloudinaryStorage()
+    if Image is None and IMAGE_VARIANT_WIDTHS:
+        print("⚠️ Pillow non installé : pas de variantes WebP, les images originales seront servies")
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "local":
+        return LocalStorage()
+    raise RuntimeError(f"STORAGE_BACKEND inconnu: {backend}")
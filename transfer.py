@@ -0,0 +1,311 @@
+"""Import / export en flux de la banque de questions.
+
+Formats acceptés : NDJSON (un objet JSON par ligne) ou un tableau JSON, détecté
+au premier caractère. Le flux est découpé au fil de la lecture : seul le lot en
+cours est gardé en mémoire, et chaque lot de `TRANSFER_CHUNK_SIZE` questions est
+inséré dans sa propre transaction, sans passer par le cache mémoire des questions
+(invalidé, rechargé à la lecture suivante). Les doublons (même question et même réponse),
+dans le fichier comme déjà en base, sont ignorés.
+
+Utilisé par `seed_db.py` (ligne de commande) et par les endpoints
+`POST /api/questions/import` et `GET /api/questions/export`.
+"""
+import codecs
+import json
+import os
+from typing import AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from database import (
+    afind_existing_questions,
+    aload_questions_page,
+    asave_questions,
+    find_existing_questions,
+    load_questions_page,
+    save_questions,
+)
+
+# Questions insérées par transaction
+TRANSFER_CHUNK_SIZE = int(os.getenv("TRANSFER_CHUNK_SIZE", "1000"))
+# Taille des lectures (caractères) et des pages lues en base à l'export
+READ_SIZE = 64 * 1024
+EXPORT_PAGE_SIZE = 1000
+
+FORMATS = {"ndjson": "application/x-ndjson", "json": "application/json"}
+
+
+class TransferError(Exception):
+    """Fichier illisible"""
+
+
+class ImportFailed(TransferError):
+    """Échec de l'insertion d'un lot (les lots précédents restent en base)"""
+
+
+class ExportFailed(TransferError):
+    """Lecture de la base interrompue : l'export est incomplet"""
+
+
+class ImportStats:
+    def __init__(self):
+        self.read = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.invalid = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"read": self.read, "inserted": self.inserted, "duplicates": self.duplicates, "invalid": self.invalid}
+
+    def __str__(self) -> str:
+        return (f"{self.read} lues, {self.inserted} insérées, {self.duplicates} doublons, "
+                f"{self.invalid} invalides")
+
+
+class QuestionStreamParser:
+    """Découpe un flux de texte (NDJSON ou tableau JSON) en objets, morceau par morceau"""
+
+    def __init__(self):
+        self._buffer = ""
+        self._mode: Optional[str] = None  # "ndjson" ou "array"
+        self._done = False
+        self._decoder = json.JSONDecoder()
+        # Caractères du tableau déjà consommés (pour situer une erreur)
+        self._consumed = 0
+
+    def feed(self, text: str) -> List:
+        self._buffer += text
+        return self._drain(final=False)
+
+    def close(self) -> List:
+        items = self._drain(final=True)
+        if self._mode == "array" and not self._done:
+            raise TransferError("Tableau JSON incomplet (']' manquant)")
+        return items
+
+    def _drain(self, final: bool) -> List:
+        if self._mode is None:
+            stripped = self._buffer.lstrip("\ufeff \t\r\n")
+            if not stripped:
+                return []
+            self._mode = "array" if stripped[0] == "[" else "ndjson"
+            self._buffer = stripped[1:] if self._mode == "array" else stripped
+        if self._mode == "ndjson":
+            return self._drain_lines(final)
+        return self._drain_array(final)
+
+    def _drain_lines(self, final: bool) -> List:
+        lines = self._buffer.split("\n")
+        self._buffer = "" if final else lines.pop()
+        items = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                # Ligne illisible : comptée comme invalide, la suite du fichier reste utilisable
+                items.append(None)
+        return items
+
+    def _drain_array(self, final: bool) -> List:
+        items = []
+        buffer, pos = self._buffer, 0
+        while not self._done:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buffer):
+                break
+            if buffer[pos] == "]":
+                self._done = True
+                pos += 1
+                break
+            try:
+                item, end = self._decoder.raw_decode(buffer, pos)
+            except ValueError:
+                if final:
+                    raise TransferError(f"JSON invalide vers le caractère {self._consumed + pos} du tableau")
+                break  # élément coupé : attendre la suite
+            if end == len(buffer) and not final:
+                break  # un nombre peut être coupé en deux : attendre le séparateur
+            items.append(item)
+            pos = end
+        self._buffer = buffer[pos:]
+        self._consumed += pos
+        return items
+
+
+def clean_question(item) -> Optional[Dict[str, str]]:
+    """Question prête à insérer, ou None si un champ manque (les autres champs sont ignorés)"""
+    if not isinstance(item, dict):
+        return None
+    fields = {}
+    for field in ("image", "question", "answer"):
+        value = item.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return None
+        fields[field] = value.strip()
+    return fields
+
+
+def iter_questions(stream: TextIO) -> Iterator:
+    """Objets lus depuis un fichier texte, sans le charger en entier"""
+    parser = QuestionStreamParser()
+    while True:
+        text = stream.read(READ_SIZE)
+        if not text:
+            break
+        yield from parser.feed(text)
+    yield from parser.close()
+
+
+async def aiter_questions(chunks: AsyncIterable[bytes]) -> AsyncIterator:
+    """Objets lus depuis un flux d'octets UTF-8 (corps d'une requête HTTP)"""
+    parser = QuestionStreamParser()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    async for chunk in chunks:
+        for item in parser.feed(decoder.decode(chunk)):
+            yield item
+    for item in parser.feed(decoder.decode(b"", final=True)) + parser.close():
+        yield item
+
+
+def _key(question: Dict[str, str]):
+    return question["question"], question["answer"]
+
+
+def _dedupe_chunk(chunk: List[Dict[str, str]], existing, stats: ImportStats) -> List[Dict[str, str]]:
+    """Retire du lot les questions déjà en base et celles en double dans le lot"""
+    seen = set(existing)
+    unique = []
+    for question in chunk:
+        key = _key(question)
+        if key in seen:
+            stats.duplicates += 1
+            continue
+        seen.add(key)
+        unique.append(question)
+    return unique
+
+
+def _chunks(items: Iterable, stats: ImportStats, chunk_size: int) -> Iterator[List[Dict[str, str]]]:
+    chunk = []
+    for item in items:
+        stats.read += 1
+        question = clean_question(item)
+        if question is None:
+            stats.invalid += 1
+            continue
+        chunk.append(question)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_questions(items: Iterable, chunk_size: int = TRANSFER_CHUNK_SIZE, skip_duplicates: bool = True,
+                     on_progress: Optional[Callable[[ImportStats], None]] = None) -> ImportStats:
+    """Insère les questions par lots (une transaction par lot). Les lots déjà insérés
+    restent en base si un lot échoue (ImportFailed)."""
+    stats = ImportStats()
+    for chunk in _chunks(items, stats, chunk_size):
+        if skip_duplicates:
+            # Les lots précédents sont déjà en base : les doublons entre lots sont trouvés ici
+            try:
+                existing = find_existing_questions(chunk)
+            except SQLAlchemyError as e:
+                raise ImportFailed(f"Recherche des doublons impossible ({stats})") from e
+            chunk = _dedupe_chunk(chunk, existing, stats)
+        if chunk:
+            created = save_questions(chunk, fill_cache=False)
+            if not created:
+                raise ImportFailed(f"Échec de l'insertion d'un lot ({stats})")
+            stats.inserted += len(created)
+        if on_progress is not None:
+            on_progress(stats)
+    return stats
+
+
+async def aimport_questions(items: AsyncIterable, chunk_size: int = TRANSFER_CHUNK_SIZE, skip_duplicates: bool = True,
+                            on_progress: Optional[Callable[[ImportStats], None]] = None) -> ImportStats:
+    """Version asynchrone de import_questions : l'accès à la base passe par le pool de threads"""
+    stats = ImportStats()
+    chunk: List[Dict[str, str]] = []
+
+    async def flush(chunk):
+        if skip_duplicates:
+            try:
+                existing = await afind_existing_questions(chunk)
+            except SQLAlchemyError as e:
+                raise ImportFailed(f"Recherche des doublons impossible ({stats})") from e
+            chunk = _dedupe_chunk(chunk, existing, stats)
+        if chunk:
+            created = await asave_questions(chunk, fill_cache=False)
+            if not created:
+                raise ImportFailed(f"Échec de l'insertion d'un lot ({stats})")
+            stats.inserted += len(created)
+        if on_progress is not None:
+            on_progress(stats)
+
+    async for item in items:
+        stats.read += 1
+        question = clean_question(item)
+        if question is None:
+            stats.invalid += 1
+            continue
+        chunk.append(question)
+        if len(chunk) >= chunk_size:
+            await flush(chunk)
+            chunk = []
+    if chunk:
+        await flush(chunk)
+    return stats
+
+
+def _encode(question: Dict) -> str:
+    return json.dumps(question, ensure_ascii=False, separators=(",", ":"))
+
+
+def _frame(questions: List[Dict], fmt: str, first: bool) -> str:
+    if fmt == "ndjson":
+        return "".join(_encode(q) + "\n" for q in questions)
+    body = ",\n".join(_encode(q) for q in questions)
+    return body if first else ",\n" + body
+
+
+def export_questions(fmt: str = "ndjson", page_size: int = EXPORT_PAGE_SIZE) -> Iterator[str]:
+    """Texte de l'export, page par page (pagination par id, mémoire constante).
+    Lève ExportFailed si la base échoue en cours de route (le flux ne se termine pas proprement)."""
+    if fmt == "json":
+        yield "[\n"
+    after_id, first = 0, True
+    while True:
+        try:
+            page = load_questions_page(after_id, page_size)
+        except SQLAlchemyError as e:
+            raise ExportFailed(f"Lecture des questions après l'id {after_id} impossible") from e
+        if not page:
+            break
+        yield _frame(page, fmt, first)
+        after_id, first = page[-1]["id"], False
+    if fmt == "json":
+        yield "\n]\n"
+
+
+async def aexport_questions(fmt: str = "ndjson", page_size: int = EXPORT_PAGE_SIZE) -> AsyncIterator[str]:
+    if fmt == "json":
+        yield "[\n"
+    after_id, first = 0, True
+    while True:
+        try:
+            page = await aload_questions_page(after_id, page_size)
+        except SQLAlchemyError as e:
+            raise ExportFailed(f"Lecture des questions après l'id {after_id} impossible") from e
+        if not page:
+            break
+        yield _frame(page, fmt, first)
+        after_id, first = page[-1]["id"], False
+    if fmt == "json":
+        yield "\n]\n"